@@ -0,0 +1,134 @@
+"""
+Stress test for wrapper objects shared between threads.
+
+Many threads read properties of the same Disk, Partition and NetIface
+objects while another thread keeps refreshing them. The script reports
+errors, the number of udev lookups performed compared to the number of
+refreshes, and overall throughput. Each refresh allows at most one lookup, so
+the script exits with a non-zero status if there were errors, or more lookups
+than refreshes.
+
+Usage: python stress.py [THREADS] [SECONDS]
+"""
+
+from __future__ import print_function, division
+
+import sys
+import threading
+import time
+
+import hwd.network
+import hwd.storage
+import hwd.udev
+import hwd.wrapper
+
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+DURATION = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+REFRESH_INTERVAL = 0.01
+
+# Count udev lookups performed by the wrappers
+lookups = [0]
+lookup_lock = threading.Lock()
+_lookup = hwd.wrapper.Wrapper._lookup
+
+
+def counting_lookup(self):
+    with lookup_lock:
+        lookups[0] += 1
+    return _lookup(self)
+
+hwd.wrapper.Wrapper._lookup = counting_lookup
+
+disks = [hwd.storage.Disk(d) for d in hwd.udev.devices_by_subsystem(
+    'block', lambda d: d.device_type == 'disk')]
+# Partitions listed by a refreshed disk are new objects created from the
+# disk's device children, so they need no lookups of their own. These are
+# kept and refreshed separately.
+parts = [p for d in disks for p in d.partitions]
+ifaces = [hwd.network.NetIface(d)
+          for d in hwd.udev.devices_by_subsystem('net')]
+objects = disks + parts + ifaces
+
+stop = threading.Event()
+ops = [0] * THREADS
+errors = []
+refreshes = [0]
+
+
+def read_disk(disk):
+    parts = disk.partitions
+    for p in parts:
+        if p.disk is not disk:
+            raise AssertionError('{} has wrong disk'.format(p.name))
+        p.size
+        p.format
+    disk.queue
+    disk.size
+    return 2 + 2 * len(parts)
+
+
+def read_part(part):
+    part.size
+    part.format
+    part.uuid
+    return 3
+
+
+def read_iface(iface):
+    iface.type
+    iface.mac
+    iface.is_connected
+    return 3
+
+
+def reader(index):
+    count = 0
+    try:
+        while not stop.is_set():
+            for disk in disks:
+                count += read_disk(disk)
+            for part in parts:
+                count += read_part(part)
+            for iface in ifaces:
+                count += read_iface(iface)
+    except Exception as exc:
+        errors.append(exc)
+    ops[index] = count
+
+
+def refresher():
+    while not stop.is_set():
+        for obj in objects:
+            obj.refresh()
+            refreshes[0] += 1
+        time.sleep(REFRESH_INTERVAL)
+
+
+if not objects:
+    print('No devices found')
+    sys.exit(1)
+
+threads = [threading.Thread(target=reader, args=(i,))
+           for i in range(THREADS)]
+threads.append(threading.Thread(target=refresher))
+start = time.time()
+for t in threads:
+    t.start()
+time.sleep(DURATION)
+stop.set()
+for t in threads:
+    t.join()
+elapsed = time.time() - start
+
+print('Objects:    {} disks, {} partitions, {} interfaces'.format(
+    len(disks), len(parts), len(ifaces)))
+print('Threads:    {}'.format(THREADS))
+print('Refreshes:  {}'.format(refreshes[0]))
+print('Lookups:    {} (at most {} allowed)'.format(lookups[0], refreshes[0]))
+print('Throughput: {:.0f} property reads/s'.format(sum(ops) / elapsed))
+print('Errors:     {}'.format(len(errors)))
+for exc in errors[:5]:
+    print('    {!r}'.format(exc))
+if lookups[0] > refreshes[0]:
+    print('Duplicate lookups detected')
+sys.exit(1 if errors or lookups[0] > refreshes[0] else 0)
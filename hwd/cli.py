@@ -0,0 +1,135 @@
+"""
+Command line interface.
+
+The ``hwd`` command provides the following subcommands:
+
+``hwd export``
+    Write the inventory to standard output or a file (see
+    :py:mod:`hwd.export`).
+
+``hwd daemon``
+    Run the inventory daemon (see :py:mod:`hwd.daemon`).
+
+``hwd watch``
+    Show a live view of storage and network devices (see :py:mod:`hwd.top`).
+
+``hwd metrics``
+    Serve Prometheus metrics over HTTP or write them to a file (see
+    :py:mod:`hwd.metrics`).
+
+Modules implementing the daemon, metrics and watch subcommands are only
+imported when the subcommand runs, so that missing optional parts of the
+standard library (e.g., curses on minimal builds) only affect the subcommands
+that need them.
+"""
+
+from __future__ import print_function
+
+import argparse
+import logging
+import sys
+
+from . import __version__
+from . import client
+from . import export
+
+
+def _default(value, default):
+    # Options whose defaults are defined in lazily imported modules default
+    # to None in the parser
+    return default if value is None else value
+
+
+def cmd_export(opts):
+    if opts.output == '-':
+        export.dump(sys.stdout, opts.format)
+    else:
+        with open(opts.output, 'wb') as fd:
+            export.dump(fd, opts.format)
+
+
+def cmd_daemon(opts):
+    from . import daemon
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    daemon.run(opts.socket, _default(opts.interval, daemon.DEFAULT_INTERVAL))
+
+
+def cmd_metrics(opts):
+    from . import metrics
+    interval = _default(opts.interval, metrics.DEFAULT_TTL)
+    if opts.textfile:
+        metrics.write_textfile_forever(opts.textfile, interval)
+        return
+    host, _, port = opts.listen.rpartition(':')
+    try:
+        address = (host, int(port))
+    except ValueError:
+        raise ValueError('Invalid listen address {}'.format(opts.listen))
+    exporter = metrics.Exporter(interval)
+    metrics.MetricsServer(exporter, address).serve_forever()
+
+
+def cmd_watch(opts):
+    try:
+        from . import top
+    except ImportError as exc:
+        raise ValueError('watch is not available: {}'.format(exc))
+    top.main(_default(opts.interval, top.DEFAULT_INTERVAL),
+             _default(opts.usage_interval, top.DEFAULT_USAGE_INTERVAL))
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='hwd',
+                                     description='Hardware information')
+    parser.add_argument('--version', action='version', version=__version__)
+    sub = parser.add_subparsers(dest='command', metavar='COMMAND')
+    sub.required = True
+
+    p = sub.add_parser('export', help='export the inventory')
+    p.add_argument('--format', '-f', default='json',
+                   choices=export.FORMATS,
+                   help='output format (default: %(default)s)')
+    p.add_argument('--output', '-o', default='-',
+                   help='output file (default: standard output)')
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('daemon', help='run the inventory daemon')
+    p.add_argument('--socket', '-s', default=client.DEFAULT_SOCKET,
+                   help='socket path (default: %(default)s)')
+    p.add_argument('--interval', '-i', type=float,
+                   help='refresh interval in seconds for information that '
+                   'does not generate events (default: 5)')
+    p.set_defaults(func=cmd_daemon)
+
+    p = sub.add_parser('metrics', help='export Prometheus metrics')
+    p.add_argument('--listen', '-l', default='127.0.0.1:9101',
+                   help='address to serve metrics on (default: '
+                   '%(default)s)')
+    p.add_argument('--textfile', '-t', metavar='PATH',
+                   help='periodically write metrics to PATH instead of '
+                   'serving them')
+    p.add_argument('--interval', '-i', type=float,
+                   help='seconds metrics are cached for, or interval between '
+                   'writes with --textfile (default: 10)')
+    p.set_defaults(func=cmd_metrics)
+
+    p = sub.add_parser('watch', help='show a live view of devices')
+    p.add_argument('--interval', '-i', type=float,
+                   help='seconds between I/O rate updates (default: 1)')
+    p.add_argument('--usage-interval', '-u', type=float,
+                   help='seconds between disk usage and address updates '
+                   '(default: 10)')
+    p.set_defaults(func=cmd_watch)
+    return parser
+
+
+def main(args=None):
+    opts = get_parser().parse_args(args)
+    try:
+        opts.func(opts)
+    except ValueError as exc:
+        print('hwd: {}'.format(exc), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 1
+    return 0
@@ -0,0 +1,124 @@
+"""
+Client for the hwd inventory daemon (see :py:mod:`hwd.daemon`).
+
+This module only depends on the standard library, so it can be used by
+programs that do not have pyudev or netifaces installed.
+"""
+
+import json
+import socket
+import struct
+
+#: Default path of the daemon socket
+DEFAULT_SOCKET = '/run/hwd.sock'
+
+#: Maximum accepted frame size in bytes
+MAX_FRAME = 16 * 1024 * 1024
+
+FRAME_HEADER = struct.Struct('>I')
+
+
+class ProtocolError(Exception):
+    """
+    Raised when a malformed frame is received, or when the daemon responds
+    with an error.
+    """
+    pass
+
+
+def encode_frame(obj):
+    """
+    Return ``obj`` encoded as a frame.
+    """
+    payload = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(sock):
+    """
+    Read a single frame from ``sock`` and return the decoded object. Returns
+    ``None`` if the connection is closed before a complete frame is read.
+    """
+    header = _recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+    size, = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ProtocolError('Frame of {} bytes is too large'.format(size))
+    payload = _recv_exactly(sock, size)
+    if payload is None:
+        return None
+    try:
+        return json.loads(payload.decode('utf-8'))
+    except ValueError:
+        raise ProtocolError('Frame does not contain valid JSON')
+
+
+class Client(object):
+    """
+    Client for the inventory daemon listening on ``path``.
+
+    Example::
+
+        >>> client = Client()
+        >>> [d['node'] for d in client.get('disks')]
+        [u'/dev/sda', u'/dev/mmcblk0']
+    """
+
+    def __init__(self, path=DEFAULT_SOCKET, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+
+    def request(self, op, **kwargs):
+        """
+        Send a request for operation ``op`` and return the response. Raises
+        :py:class:`~ProtocolError` if the daemon reports an error.
+        """
+        kwargs['op'] = op
+        self.sock.sendall(encode_frame(kwargs))
+        resp = read_frame(self.sock)
+        if resp is None:
+            raise ProtocolError('Connection closed by daemon')
+        if not resp.get('ok'):
+            raise ProtocolError(resp.get('error'))
+        return resp
+
+    def ping(self):
+        """
+        Return the current inventory generation.
+        """
+        return self.request('ping')['generation']
+
+    def get(self, what='all'):
+        """
+        Return records for ``what`` (see module documentation for possible
+        values).
+        """
+        return self.request('get', what=what)['data']
+
+    def subscribe(self):
+        """
+        Iterator yielding change events. The connection cannot be used for
+        other requests after subscribing.
+        """
+        self.request('subscribe')
+        while True:
+            event = read_frame(self.sock)
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        self.sock.close()
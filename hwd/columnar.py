@@ -0,0 +1,428 @@
+"""
+Columnar view of the storage inventory.
+
+The inventory is converted into tables where each column is stored
+separately. Numeric columns are ``array.array`` objects, which support the
+buffer protocol and can be wrapped by NumPy without copying (see
+:py:meth:`~Table.to_numpy`). String columns are dictionary-encoded: values
+are stored as integer codes into a list of distinct values, so filtering on
+them only compares integers. When NumPy is installed, queries run as
+vectorised operations on the column arrays, and otherwise they fall back to
+plain Python loops.
+
+Example::
+
+    >>> t = columnar.partition_table()
+    >>> rows = t.where(format='vfat', bus='usb', is_removable=True)
+    >>> t.row(t.argmax('free', rows))['node']
+    u'/dev/sdb1'
+    >>> t.group_sum('used', by='bus')
+    {u'ata': 83201245184, u'usb': 1536000}
+"""
+
+from array import array
+
+from . import records
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 'q' (64-bit) typecode is not available on Python 2
+try:
+    INT_TYPE = array('q').typecode
+except ValueError:
+    INT_TYPE = 'l'
+CODE_TYPE = 'i'
+
+#: Column types
+NUMERIC = 'numeric'
+BOOLEAN = 'boolean'
+CATEGORICAL = 'categorical'
+
+#: Columns of the partition table. Disk columns are prefixed with ``disk_``,
+#: except for ``bus``, ``is_removable`` and ``is_read_only``, which only
+#: apply to disks.
+PARTITION_COLUMNS = (
+    ('name', CATEGORICAL),
+    ('node', CATEGORICAL),
+    ('label', CATEGORICAL),
+    ('uuid', CATEGORICAL),
+    ('format', CATEGORICAL),
+    ('usage', CATEGORICAL),
+    ('scheme', CATEGORICAL),
+    ('number', NUMERIC),
+    ('offset', NUMERIC),
+    ('sectors', NUMERIC),
+    ('size', NUMERIC),
+    ('is_mounted', BOOLEAN),
+    ('mount_point', CATEGORICAL),
+    ('total', NUMERIC),
+    ('used', NUMERIC),
+    ('free', NUMERIC),
+    ('disk_name', CATEGORICAL),
+    ('disk_vendor', CATEGORICAL),
+    ('disk_model', CATEGORICAL),
+    ('bus', CATEGORICAL),
+    ('is_removable', BOOLEAN),
+    ('is_read_only', BOOLEAN),
+)
+
+#: Columns of the disk table
+DISK_COLUMNS = (
+    ('name', CATEGORICAL),
+    ('node', CATEGORICAL),
+    ('vendor', CATEGORICAL),
+    ('model', CATEGORICAL),
+    ('bus', CATEGORICAL),
+    ('part_table_type', CATEGORICAL),
+    ('sectors', NUMERIC),
+    ('size', NUMERIC),
+    ('partitions', NUMERIC),
+    ('is_removable', BOOLEAN),
+    ('is_read_only', BOOLEAN),
+)
+
+
+class NumericColumn(object):
+    """
+    Column of integers stored in an ``array.array``. Missing values are
+    stored as -1, matching the convention used by the wrapper properties.
+    """
+
+    def __init__(self, typecode=INT_TYPE):
+        self.values = array(typecode)
+
+    def append(self, value):
+        self.values.append(-1 if value is None else int(value))
+
+    def encode(self, value):
+        return value
+
+    def get(self, i):
+        return self.values[i]
+
+    def to_numpy(self):
+        return numpy.frombuffer(self.values, dtype=self.values.typecode)
+
+
+class BooleanColumn(NumericColumn):
+    """
+    Column of booleans stored as bytes (0 or 1).
+    """
+
+    def __init__(self):
+        super(BooleanColumn, self).__init__('b')
+
+    def append(self, value):
+        self.values.append(1 if value else 0)
+
+    def encode(self, value):
+        return 1 if value else 0
+
+    def get(self, i):
+        return bool(self.values[i])
+
+    def to_numpy(self):
+        return super(BooleanColumn, self).to_numpy().view(numpy.bool_)
+
+
+class CategoricalColumn(object):
+    """
+    Dictionary-encoded column. ``categories`` is a list of distinct values,
+    and ``values`` is an array of indices into that list.
+    """
+
+    def __init__(self):
+        self.values = array(CODE_TYPE)
+        self.categories = []
+        self._codes = {}
+
+    def append(self, value):
+        try:
+            code = self._codes[value]
+        except KeyError:
+            code = self._codes[value] = len(self.categories)
+            self.categories.append(value)
+        self.values.append(code)
+
+    def encode(self, value):
+        """
+        Return the code for ``value``, or -1 if the value does not appear in
+        the column (which never matches any row).
+        """
+        return self._codes.get(value, -1)
+
+    def get(self, i):
+        return self.categories[self.values[i]]
+
+    def to_numpy(self):
+        return numpy.frombuffer(self.values, dtype=CODE_TYPE)
+
+
+def _view(values):
+    """
+    Return a NumPy array that shares memory with array ``values``.
+    """
+    return numpy.frombuffer(values, dtype=values.typecode)
+
+
+COLUMN_TYPES = {
+    NUMERIC: NumericColumn,
+    BOOLEAN: BooleanColumn,
+    CATEGORICAL: CategoricalColumn,
+}
+
+
+class Table(object):
+    """
+    Table with columns described by ``schema``, a sequence of ``(name,
+    type)`` tuples. Rows are added using :py:meth:`~append`.
+
+    Methods that select rows return and accept lists of row indices, so
+    selections can be chained without copying any column data.
+    """
+
+    def __init__(self, schema):
+        self.schema = tuple(schema)
+        self.columns = dict((name, COLUMN_TYPES[kind]())
+                            for name, kind in self.schema)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, row):
+        """
+        Append a row given as a dict. Missing keys are stored as missing
+        values.
+        """
+        for name, _ in self.schema:
+            self.columns[name].append(row.get(name))
+        self.length += 1
+
+    def column(self, name):
+        """
+        Return the underlying array of column ``name``. For categorical
+        columns, this is the array of codes.
+        """
+        return self.columns[name].values
+
+    def row(self, i):
+        """
+        Return the row at index ``i`` as a dict.
+        """
+        return dict((name, self.columns[name].get(i))
+                    for name, _ in self.schema)
+
+    def _rows(self, rows):
+        return range(self.length) if rows is None else rows
+
+    def _vectorised(self, rows):
+        """
+        Return ``True`` if queries over ``rows`` should run on NumPy arrays.
+        Empty tables are excluded because older NumPy versions cannot create
+        arrays from empty buffers.
+        """
+        return numpy is not None and self.length > 0 and (
+            rows is None or len(rows) > 0)
+
+    def _values(self, name, rows):
+        """
+        Return a NumPy array of raw values (codes for categorical columns)
+        of column ``name`` for ``rows``, which is either ``None`` for all rows
+        or a NumPy array of indices.
+        """
+        values = _view(self.columns[name].values)
+        return values if rows is None else values[rows]
+
+    @staticmethod
+    def _indices(rows):
+        return None if rows is None else numpy.asarray(rows, dtype=numpy.intp)
+
+    def where(self, rows=None, **conditions):
+        """
+        Return a list of indices of rows where columns equal given values
+        (e.g., ``where(format='vfat', is_removable=True)``). If ``rows`` is
+        given, only those rows are considered.
+        """
+        if self._vectorised(rows):
+            idx = self._indices(rows)
+            mask = None
+            for name, value in conditions.items():
+                match = (self._values(name, idx) ==
+                         self.columns[name].encode(value))
+                mask = match if mask is None else mask & match
+            if mask is None:
+                return list(self._rows(rows))
+            if idx is None:
+                return numpy.flatnonzero(mask).tolist()
+            return idx[mask].tolist()
+        rows = self._rows(rows)
+        for name, value in conditions.items():
+            col = self.columns[name]
+            values = col.values
+            code = col.encode(value)
+            rows = [i for i in rows if values[i] == code]
+        return list(rows)
+
+    def filter(self, name, predicate, rows=None):
+        """
+        Return a list of indices of rows for which ``predicate`` returns
+        ``True`` when called with the value of column ``name``. For
+        categorical columns, the predicate is only evaluated once per
+        distinct value.
+        """
+        col = self.columns[name]
+        values = col.values
+        if isinstance(col, CategoricalColumn):
+            codes = set(c for c, v in enumerate(col.categories)
+                        if predicate(v))
+            if self._vectorised(rows):
+                idx = self._indices(rows)
+                mask = numpy.isin(self._values(name, idx), list(codes))
+                if idx is None:
+                    return numpy.flatnonzero(mask).tolist()
+                return idx[mask].tolist()
+            return [i for i in self._rows(rows) if values[i] in codes]
+        return [i for i in self._rows(rows) if predicate(values[i])]
+
+    def sort(self, name, rows=None, reverse=False):
+        """
+        Return a list of row indices sorted by column ``name``. Categorical
+        columns are sorted by value.
+        """
+        col = self.columns[name]
+        values = col.values
+        if isinstance(col, CategoricalColumn):
+            cats = col.categories
+            key = lambda i: (cats[values[i]] is not None, cats[values[i]])
+        else:
+            key = values.__getitem__
+        if not self._vectorised(rows):
+            return sorted(self._rows(rows), key=key, reverse=reverse)
+        idx = self._indices(rows)
+        keys = self._values(name, idx)
+        if isinstance(col, CategoricalColumn):
+            # Sort by rank of each category's value instead of by code
+            order = sorted(range(len(cats)),
+                           key=lambda c: (cats[c] is not None, cats[c]))
+            ranks = numpy.empty(len(cats), dtype=numpy.intp)
+            ranks[order] = numpy.arange(len(cats))
+            keys = ranks[keys]
+        else:
+            keys = keys.astype(numpy.int64)
+        # Stable sort on negated keys keeps equal rows in their original
+        # order, like sorted() with reverse=True
+        order = numpy.argsort(-keys if reverse else keys, kind='stable')
+        if idx is None:
+            return order.tolist()
+        return idx[order].tolist()
+
+    def argmax(self, name, rows=None):
+        """
+        Return the index of the row with the largest value in numeric column
+        ``name``, or ``None`` if there are no rows.
+        """
+        if self._vectorised(rows):
+            idx = self._indices(rows)
+            i = int(self._values(name, idx).argmax())
+            return i if idx is None else int(idx[i])
+        rows = self._rows(rows)
+        if not len(rows):
+            return None
+        return max(rows, key=self.columns[name].values.__getitem__)
+
+    def sum(self, name, rows=None):
+        """
+        Return the sum of numeric column ``name``, ignoring missing values.
+        """
+        if self._vectorised(rows):
+            values = self._values(name, self._indices(rows))
+            return int(values[values > 0].sum())
+        values = self.columns[name].values
+        if rows is None:
+            return sum(v for v in values if v > 0)
+        return sum(values[i] for i in rows if values[i] > 0)
+
+    def group_sum(self, name, by, rows=None):
+        """
+        Return a dict mapping values of categorical column ``by`` to sums of
+        numeric column ``name``, ignoring missing values.
+        """
+        group = self.columns[by]
+        if self._vectorised(rows):
+            idx = self._indices(rows)
+            values = self._values(name, idx)
+            codes = self._values(by, idx)
+            mask = values > 0
+            # Weights are summed as floats, which is exact up to 2**53
+            sums = numpy.bincount(codes[mask], weights=values[mask],
+                                  minlength=len(group.categories))
+            return dict(zip(group.categories, (int(round(v)) for v in sums)))
+        values = self.columns[name].values
+        codes = group.values
+        sums = [0] * len(group.categories)
+        for i in self._rows(rows):
+            if values[i] > 0:
+                sums[codes[i]] += values[i]
+        return dict(zip(group.categories, sums))
+
+    def to_numpy(self):
+        """
+        Return a dict mapping column names to NumPy arrays that share memory
+        with the table. Categorical columns are returned as arrays of codes,
+        and their categories are available as ``columns[name].categories``.
+        Raises ``RuntimeError`` if NumPy is not installed.
+        """
+        if numpy is None:
+            raise RuntimeError('NumPy is not installed')
+        return dict((name, col.to_numpy())
+                    for name, col in self.columns.items())
+
+
+def partition_table(data=None):
+    """
+    Return a :py:class:`~Table` with one row per partition, using
+    :py:data:`~PARTITION_COLUMNS`. ``data`` is the return value of
+    :py:func:`~hwd.records.collect`, and is obtained by calling that
+    function if omitted. UBI volumes are included with missing disk columns.
+    """
+    if data is None:
+        data = records.collect()
+    table = Table(PARTITION_COLUMNS)
+
+    def add(part, disk):
+        row = dict(part)
+        row['mount_point'] = (part['mount_points'] or [None])[-1]
+        row['is_mounted'] = bool(part['mount_points'])
+        row.update(part['stat'] or {})
+        for key in ('name', 'vendor', 'model'):
+            row['disk_' + key] = disk.get(key)
+        for key in ('bus', 'is_removable', 'is_read_only'):
+            row[key] = disk.get(key)
+        table.append(row)
+
+    for disk in data['disks']:
+        for part in disk['partitions']:
+            add(part, disk)
+    for vol in data['ubi']:
+        add(vol, {})
+    return table
+
+
+def disk_table(data=None):
+    """
+    Return a :py:class:`~Table` with one row per disk, using
+    :py:data:`~DISK_COLUMNS`. See :py:func:`~partition_table` for the
+    meaning of ``data``.
+    """
+    if data is None:
+        data = records.collect()
+    table = Table(DISK_COLUMNS)
+    for disk in data['disks']:
+        row = dict(disk)
+        row['partitions'] = len(disk['partitions'])
+        table.append(row)
+    return table
@@ -0,0 +1,9 @@
+"""
+Helpers that smooth over differences between Python versions.
+"""
+
+import time
+
+#: Monotonic clock used for interval and expiry calculations (falls back to
+#: wall clock on Python versions that do not have ``time.monotonic()``)
+clock = getattr(time, 'monotonic', time.time)
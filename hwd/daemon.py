@@ -0,0 +1,284 @@
+"""
+Inventory daemon.
+
+The daemon owns the udev monitor, the mount table, and network state, and
+answers inventory queries over a UNIX domain socket. Clients (see
+:py:mod:`hwd.client`) do not need pyudev or netifaces, and since answers are
+encoded once per inventory generation, queries are answered without touching
+sysfs.
+
+Protocol
+--------
+
+Messages in both directions are frames consisting of a 4-byte big-endian
+payload length followed by a UTF-8 encoded JSON object. Each request frame
+has an ``'op'`` key:
+
+``{"op": "ping"}``
+    Returns ``{"ok": true, "generation": N}``.
+
+``{"op": "get", "what": "disks"}``
+    Returns ``{"ok": true, "generation": N, "data": ...}``. ``what`` is one
+    of ``'disks'``, ``'ubi'``, ``'ifaces'``, ``'mounts'``, or ``'all'``
+    (default). Records are in the format produced by
+    :py:func:`~hwd.records.collect`.
+
+``{"op": "subscribe"}``
+    Returns ``{"ok": true, "generation": N}``, after which the daemon sends
+    an event frame every time the inventory changes, until the client
+    disconnects. Event frames look like ``{"event": "change", "generation":
+    N, "subsystem": "block", "action": "add", "name": "sdb"}``. The
+    ``subsystem``, ``action`` and ``name`` keys are ``null`` for changes that
+    were picked up by periodic refresh, and ``subsystem`` is ``'mounts'`` for
+    mount table changes. Changes in used disk space smaller than
+    :py:data:`~hwd.diff.USAGE_THRESHOLD` do not count as inventory changes.
+
+Failed requests return ``{"ok": false, "error": "message"}``.
+"""
+
+import argparse
+import logging
+import os
+import select
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from . import diff
+from . import inventory
+from . import records
+from . import storage
+from . import udev
+from .client import DEFAULT_SOCKET, ProtocolError, encode_frame, read_frame
+
+#: Default interval in seconds for refreshing information that does not
+#: generate events (e.g., IP addresses and disk usage)
+DEFAULT_INTERVAL = 5
+
+#: Keys that can be requested with the 'get' operation
+KEYS = ('disks', 'ubi', 'ifaces', 'mounts')
+
+#: udev subsystems monitored by the daemon, mapped to inventory keys
+SUBSYSTEMS = {
+    'block': 'block',
+    'net': 'net',
+    'ubi': 'ubi',
+}
+
+log = logging.getLogger(__name__)
+
+
+class State(object):
+    """
+    Inventory state shared by all client connections. ``inventory`` is a
+    :py:class:`~hwd.inventory.Inventory` object used to obtain the devices.
+    """
+
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.generation = 0
+        self.data = None
+        self._lock = threading.Lock()
+        self._frames = {}
+        self._subscribers = set()
+
+    def refresh(self, keys=(), event=None):
+        """
+        Invalidate given inventory ``keys`` and collect the inventory. If it
+        differs from the previous one (see :py:func:`~hwd.diff.diff`), the
+        generation is incremented and subscribers are notified with
+        ``event``, a dictionary with ``'subsystem'``, ``'action'`` and
+        ``'name'`` keys.
+        """
+        for key in keys:
+            self.inventory.invalidate(key)
+        data = records.collect(self.inventory)
+        with self._lock:
+            # Small changes in disk usage happen all the time on busy
+            # filesystems, so exact comparison would make every refresh a
+            # new generation.
+            if self.data is not None and not diff.diff(self.data, data):
+                return
+            self.data = data
+            self.generation += 1
+            self._frames = {}
+            msg = dict(event or {}, event='change',
+                       generation=self.generation)
+            frame = encode_frame(msg)
+            for q in self._subscribers:
+                q.put(frame)
+
+    def answer(self, what):
+        """
+        Return an encoded response frame for a 'get' request. Frames are
+        cached until the next generation.
+        """
+        if not isinstance(what, (str, type(u''))):
+            return encode_frame({'ok': False,
+                                 'error': 'Invalid key {!r}'.format(what)})
+        with self._lock:
+            try:
+                return self._frames[what]
+            except KeyError:
+                pass
+            if what == 'all':
+                data = self.data
+            elif what in KEYS:
+                data = self.data[what]
+            else:
+                return encode_frame({'ok': False,
+                                     'error': 'Unknown key {}'.format(what)})
+            frame = self._frames[what] = encode_frame(
+                {'ok': True, 'generation': self.generation, 'data': data})
+            return frame
+
+    def subscribe(self):
+        """
+        Return a queue that receives encoded event frames.
+        """
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def watch(self, interval=DEFAULT_INTERVAL):
+        """
+        Refresh the state on udev and mount table events, and every
+        ``interval`` seconds otherwise. This method never returns, and is
+        normally run in a separate thread.
+
+        Errors raised while refreshing (e.g., when a device disappears while
+        it is being read) are logged, and the state is refreshed again on the
+        next event or interval.
+        """
+        mon = udev.monitor(*SUBSYSTEMS)
+        mounts = storage.MountMonitor()
+        while True:
+            try:
+                self._watch_once(mon, mounts, interval)
+            except Exception:
+                log.exception('Error while refreshing inventory')
+
+    def _watch_once(self, mon, mounts, interval):
+        readable, _, exceptional = select.select([mon], [], [mounts],
+                                                 interval)
+        if readable:
+            dev = mon.poll(timeout=0)
+            if dev is not None:
+                storage.handle_ubi_event(dev)
+                self.refresh([SUBSYSTEMS[dev.subsystem], 'mounts'], {
+                    'subsystem': dev.subsystem,
+                    'action': dev.action,
+                    'name': dev.sys_name,
+                })
+        elif exceptional and mounts.poll(timeout=0):
+            self.refresh(['mounts'], {'subsystem': 'mounts',
+                                      'action': 'change', 'name': None})
+        else:
+            self.refresh(event={'subsystem': None, 'action': None,
+                                'name': None})
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Handles requests on a single client connection.
+    """
+
+    def handle(self):
+        state = self.server.state
+        while True:
+            try:
+                req = read_frame(self.request)
+            except ProtocolError as exc:
+                self.respond({'ok': False, 'error': str(exc)})
+                return
+            if req is None:
+                return
+            op = req.get('op') if isinstance(req, dict) else None
+            if op == 'ping':
+                self.respond({'ok': True, 'generation': state.generation})
+            elif op == 'get':
+                self.request.sendall(state.answer(req.get('what', 'all')))
+            elif op == 'subscribe':
+                self.stream(state)
+                return
+            else:
+                self.respond({'ok': False,
+                              'error': 'Unknown operation {}'.format(op)})
+
+    def respond(self, obj):
+        self.request.sendall(encode_frame(obj))
+
+    def stream(self, state):
+        q = state.subscribe()
+        try:
+            self.respond({'ok': True, 'generation': state.generation})
+            while True:
+                self.request.sendall(q.get())
+        except socket.error:
+            pass
+        finally:
+            state.unsubscribe(q)
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    UNIX domain socket server that answers inventory queries from ``state``,
+    a :py:class:`~State` object. Stale socket file at ``path`` is removed
+    before binding.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, state, path=DEFAULT_SOCKET):
+        self.state = state
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+
+
+def run(path=DEFAULT_SOCKET, interval=DEFAULT_INTERVAL):
+    """
+    Run the daemon on socket ``path``. This function does not return.
+    """
+    # Cached devices are invalidated by events, so they never need to expire
+    # on their own.
+    state = State(inventory.Inventory(default_ttl=float('inf')))
+    state.refresh()
+    watcher = threading.Thread(target=state.watch, args=(interval,))
+    watcher.daemon = True
+    watcher.start()
+    Server(state, path).serve_forever()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='hwd inventory daemon')
+    parser.add_argument('--socket', '-s', default=DEFAULT_SOCKET,
+                        help='socket path (default: %(default)s)')
+    parser.add_argument('--interval', '-i', type=float,
+                        default=DEFAULT_INTERVAL,
+                        help='refresh interval in seconds for information '
+                        'that does not generate events (default: '
+                        '%(default)s)')
+    opts = parser.parse_args(args)
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s')
+    run(opts.socket, opts.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Differences between inventory snapshots.
+
+Snapshots can be in any of the formats produced by hwd: the dictionary
+returned by :py:func:`~hwd.records.collect` (also used by
+:py:mod:`hwd.snapshot` and :py:mod:`hwd.daemon`), or an iterable of export
+records (see :py:mod:`hwd.export`).
+
+Records are matched between snapshots by stable identities rather than by
+position, so the diff is computed in time linear to the number of records:
+
+- disks and UBI volumes by ``system_path``
+- partitions by filesystem UUID, or ``system_path`` if there is no UUID
+- network interfaces by MAC address, or ``system_path`` if there is no MAC
+  address or it is shared by several interfaces (e.g., bridges)
+- mount table entries by device and mount point
+
+When several records of the same kind share an identity (e.g., a MAC address
+shared by a bridge and its port, or filesystems cloned with the same UUID),
+all of them are matched by ``system_path`` instead. Records whose key changes
+because duplicates appear or disappear are still matched by ``system_path``,
+and are reported under their new key. Mount table entries have no system
+path, so duplicates (e.g., stacked mounts of the same device on the same
+mount point) are told apart by their order of appearance, and the second and
+later ones get a ``#N`` suffix.
+"""
+
+from collections import namedtuple
+
+#: Changes in used disk space smaller than this many bytes are ignored
+USAGE_THRESHOLD = 1024 * 1024
+
+#: Fields that are never compared
+IGNORED_FIELDS = ('type', 'partitions')
+
+#: MAC addresses that do not identify an interface
+NULL_MACS = (None, '', '00:00:00:00:00:00')
+
+#: namedtuple representing a changed record, where ``changes`` is a dict
+#: mapping field names to ``(old, new)`` tuples
+Change = namedtuple('Change', ['kind', 'key', 'changes'])
+
+
+class Diff(object):
+    """
+    Differences between two snapshots. ``added`` is a list of ``(kind, key,
+    record)`` tuples, ``removed`` is a list of ``(kind, key)`` tuples, and
+    ``changed`` is a list of :py:class:`~Change` objects. ``kind`` is one of
+    ``'disk'``, ``'partition'``, ``'ubi'``, ``'iface'``, or ``'mount'``.
+
+    Diff objects evaluate to ``False`` when there are no differences.
+    """
+
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    __nonzero__ = __bool__
+
+    def as_dict(self):
+        """
+        Return the diff as a JSON-compatible dictionary.
+        """
+        return {
+            'added': [{'kind': k, 'key': key, 'record': r}
+                      for k, key, r in self.added],
+            'removed': [{'kind': k, 'key': key} for k, key in self.removed],
+            'changed': [{'kind': c.kind, 'key': c.key,
+                         'changes': dict((f, list(v))
+                                         for f, v in c.changes.items())}
+                        for c in self.changed],
+        }
+
+
+def _iter_typed(snapshot):
+    """
+    Iterator yielding ``(kind, record)`` tuples for all records in a
+    snapshot. Partitions are yielded as records of their own.
+    """
+    if isinstance(snapshot, dict):
+        typed = ((kind, rec)
+                 for key, kind in (('disks', 'disk'), ('ubi', 'ubi'),
+                                   ('ifaces', 'iface'), ('mounts', 'mount'))
+                 for rec in snapshot.get(key, ()))
+    else:
+        typed = ((rec.get('type'), rec) for rec in snapshot)
+    for kind, rec in typed:
+        if kind == 'header':
+            continue
+        yield kind, rec
+        if kind == 'disk':
+            for part in rec.get('partitions', ()):
+                yield 'partition', part
+
+
+def _identity(kind, rec):
+    if kind == 'partition':
+        return rec.get('uuid') or rec.get('system_path')
+    if kind == 'iface':
+        mac = rec.get('mac')
+        return mac if mac not in NULL_MACS else rec.get('system_path')
+    if kind == 'mount':
+        return '{} {}'.format(rec.get('dev'), rec.get('mdir'))
+    return rec.get('system_path')
+
+
+def index(snapshot):
+    """
+    Return a dictionary mapping ``(kind, key)`` tuples to records for all
+    records in ``snapshot``.
+    """
+    typed = [(kind, _identity(kind, rec), rec)
+             for kind, rec in _iter_typed(snapshot)]
+    counts = {}
+    for kind, ident, _ in typed:
+        counts[kind, ident] = counts.get((kind, ident), 0) + 1
+    idx = {}
+    seen = {}
+    for kind, ident, rec in typed:
+        key = (kind, ident)
+        if counts[key] > 1:
+            path = rec.get('system_path')
+            if path:
+                # Identity is not unique, so use the system path, which
+                # does not depend on which of the duplicates are present.
+                key = (kind, path)
+            else:
+                # Number the duplicates in order of appearance, which is
+                # the same in snapshots of the same state.
+                n = seen.get(key, 0)
+                seen[key] = n + 1
+                if n:
+                    key = (kind, '{}#{}'.format(ident, n))
+        idx[key] = rec
+    return idx
+
+
+def _usage_changed(old, new, threshold):
+    if old is None or new is None:
+        return old is not new
+    return (old.get('total') != new.get('total') or
+            abs(new.get('used', 0) - old.get('used', 0)) >= threshold)
+
+
+def compare(old, new, usage_threshold=USAGE_THRESHOLD):
+    """
+    Return field changes between two records as a dict mapping field names
+    to ``(old, new)`` tuples. Changes in the ``stat`` field are only
+    included if used space changed by at least ``usage_threshold`` bytes, or
+    the filesystem was resized, mounted or unmounted.
+    """
+    changes = {}
+    for field in set(old) | set(new):
+        if field in IGNORED_FIELDS:
+            continue
+        a = old.get(field)
+        b = new.get(field)
+        if field == 'stat':
+            if _usage_changed(a, b, usage_threshold):
+                changes[field] = (a, b)
+        elif a != b:
+            changes[field] = (a, b)
+    return changes
+
+
+def diff(old, new, usage_threshold=USAGE_THRESHOLD):
+    """
+    Return a :py:class:`~Diff` object describing changes between the ``old``
+    and ``new`` snapshots.
+
+    Example::
+
+        >>> d = diff(old_snapshot, records.collect())
+        >>> [(kind, key) for kind, key, rec in d.added]
+        [('disk', u'/sys/devices/.../block/sdb'),
+         ('partition', u'0E7C-E32F')]
+        >>> d.changed[0].changes
+        {'mount_points': ([], [u'/mnt/usb'])}
+    """
+    old_idx = index(old)
+    new_idx = index(new)
+    # Records whose key changed because duplicates of their identity
+    # appeared or disappeared are still matched by system path
+    by_path = dict(((key[0], rec.get('system_path')), key)
+                   for key, rec in old_idx.items()
+                   if key not in new_idx and rec.get('system_path'))
+    matched = set()
+    added = []
+    changed = []
+    for key, rec in new_idx.items():
+        prev_key = key
+        if key not in old_idx:
+            prev_key = by_path.get((key[0], rec.get('system_path')))
+            if prev_key is None:
+                added.append(key + (rec,))
+                continue
+            matched.add(prev_key)
+        changes = compare(old_idx[prev_key], rec, usage_threshold)
+        if changes:
+            changed.append(Change(key[0], key[1], changes))
+    removed = [key for key in old_idx
+               if key not in new_idx and key not in matched]
+    return Diff(added, removed, changed)
@@ -0,0 +1,132 @@
+"""
+Streaming inventory export.
+
+The inventory is exported as a stream of records, one record per device or
+mount table entry, in the order described below. Records are produced as
+devices are enumerated, so memory usage does not depend on the number of
+devices on the host.
+
+Schema
+------
+
+Every record is a JSON object (or msgpack map) with a ``'type'`` key. The
+first record in a stream is always the header:
+
+``header``
+    ``schema`` (schema version, currently ``1``), ``hwd`` (hwd version),
+    ``time`` (UNIX timestamp of the export).
+
+It is followed by zero or more records of these types, in this order:
+
+``disk``
+    Fields listed in :py:data:`~hwd.records.DISK_FIELDS`, and
+    ``partitions``, a list of partition records without the ``type`` key.
+
+``ubi``
+    Fields listed in :py:data:`~hwd.records.PARTITION_FIELDS`, and
+    ``mount_points`` and ``stat``.
+
+``iface``
+    Fields listed in :py:data:`~hwd.records.IFACE_FIELDS`.
+
+``mount``
+    Fields of :py:class:`~hwd.storage.MtabEntry`.
+
+Partition records have the fields listed in
+:py:data:`~hwd.records.PARTITION_FIELDS`, plus ``mount_points`` (list of
+mount points, newest last) and ``stat`` (``null`` or an object with
+:py:class:`~hwd.storage.Fstat` fields). Fields whose value is not known are
+``null``.
+
+Within a schema version, fields are only ever added. Consumers should ignore
+fields and record types they do not know about. Removing or changing the
+meaning of a field increments the schema version.
+
+Formats
+-------
+
+``json``
+    JSON Lines: one record per line, UTF-8 encoded.
+
+``msgpack``
+    Concatenated msgpack maps. Requires the msgpack package.
+"""
+
+import json
+import time
+
+from . import __version__
+from . import inventory
+from . import records
+
+#: Version of the export schema
+SCHEMA_VERSION = 1
+
+#: Supported output formats
+FORMATS = ('json', 'msgpack')
+
+
+def iter_records():
+    """
+    Iterator yielding inventory records in export schema format, starting
+    with the header record.
+    """
+    yield {'type': 'header', 'schema': SCHEMA_VERSION, 'hwd': __version__,
+           'time': int(time.time())}
+    mtab = inventory.load_mounts()
+    for disk in inventory.iter_disks():
+        rec = records.disk_record(disk, mtab)
+        rec['type'] = 'disk'
+        yield rec
+    for vol in inventory.iter_ubi():
+        rec = records.partition_record(vol, mtab)
+        rec['type'] = 'ubi'
+        yield rec
+    for iface in inventory.iter_ifaces():
+        rec = records.iface_record(iface)
+        rec['type'] = 'iface'
+        yield rec
+    for e in mtab:
+        rec = records.mount_record(e)
+        rec['type'] = 'mount'
+        yield rec
+
+
+def _json_encoder():
+    encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def encode(rec):
+        return (encoder.encode(rec) + '\n').encode('utf-8')
+    return encode
+
+
+def _msgpack_encoder():
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError('msgpack format requires the msgpack package')
+    return msgpack.Packer(use_bin_type=True).pack
+
+
+def dump(fd, fmt='json'):
+    """
+    Write the inventory to file object ``fd`` in given format (one of
+    :py:data:`~FORMATS`). Output is written record by record. If ``fd`` is
+    a text stream such as ``sys.stdout``, its underlying binary buffer is
+    used. Returns the number of records written.
+
+    Raises ``ValueError`` if the format is not supported.
+    """
+    if fmt == 'json':
+        encode = _json_encoder()
+    elif fmt == 'msgpack':
+        encode = _msgpack_encoder()
+    else:
+        raise ValueError('Unsupported format {}'.format(fmt))
+    out = getattr(fd, 'buffer', fd)
+    count = 0
+    for rec in iter_records():
+        out.write(encode(rec))
+        count += 1
+    out.flush()
+    return count
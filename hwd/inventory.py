@@ -0,0 +1,294 @@
+"""
+Thread-safe, cached device inventory.
+
+Enumerating udev devices and wrapping them is comparatively expensive, and in
+multi-threaded servers it is common for many threads to ask for the same
+information at the same time. The :py:class:`~Inventory` class caches the
+results of such lookups per subsystem, and guarantees that only one thread
+performs a refresh at any given time (single-flight). Other threads either
+wait for the in-flight refresh to complete, or, if a slightly out-of-date
+value is acceptable, reuse the stale value while it is being revalidated in
+the background.
+"""
+
+import threading
+
+from . import network
+from . import storage
+from . import udev
+from .compat import clock
+
+#: Default number of seconds cached values are considered fresh
+DEFAULT_TTL = 5
+
+#: Default number of seconds after expiry during which stale values may still
+#: be served while a refresh is in progress
+DEFAULT_STALE_TTL = 30
+
+
+def iter_disks():
+    """
+    Iterator yielding :py:class:`~hwd.storage.Disk` objects for all block
+    devices of 'disk' type.
+    """
+    for d in udev.devices_by_subsystem('block',
+                                       lambda d: d.device_type == 'disk'):
+        yield storage.Disk(d)
+
+
+def iter_ifaces():
+    """
+    Iterator yielding :py:class:`~hwd.network.NetIface` objects for all
+    devices in the 'net' subsystem.
+    """
+    for d in udev.devices_by_subsystem('net'):
+        yield network.NetIface(d)
+
+
+def iter_ubi():
+    """
+    Iterator yielding :py:class:`~hwd.storage.UbiVolume` objects for all UBI
+    volumes.
+    """
+    for d in udev.devices_by_subsystem('ubi', lambda d: '_' in d.sys_name):
+        yield storage.UbiVolume(d)
+
+
+def load_disks():
+    """
+    Return a list of :py:class:`~hwd.storage.Disk` objects for all block
+    devices of 'disk' type. Partitions of each disk are looked up eagerly so
+    that threads sharing the result do not race to fill the partition cache.
+    """
+    disks = list(iter_disks())
+    for disk in disks:
+        disk.partitions
+    return disks
+
+
+def load_ifaces():
+    """
+    Return a list of :py:class:`~hwd.network.NetIface` objects for all
+    devices in the 'net' subsystem.
+    """
+    return list(iter_ifaces())
+
+
+def load_ubi():
+    """
+    Return a list of :py:class:`~hwd.storage.UbiVolume` objects for all UBI
+    volumes.
+    """
+    return list(iter_ubi())
+
+
+def load_mounts():
+    """
+    Return a list of :py:class:`~hwd.storage.MtabEntry` objects for all
+    entries in /proc/mounts, or an empty list if the mount table cannot be
+    read.
+    """
+    try:
+        return list(storage.mounts())
+    except (OSError, IOError):
+        return []
+
+
+#: Loaders used by default, keyed by inventory key
+DEFAULT_LOADERS = {
+    'block': load_disks,
+    'net': load_ifaces,
+    'ubi': load_ubi,
+    'mounts': load_mounts,
+}
+
+
+class _Flight(object):
+    """
+    Single in-flight refresh. Threads that want the result of a refresh that
+    is already running wait on the flight's event instead of starting a
+    refresh of their own.
+    """
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class _Entry(object):
+    """
+    Cache entry for a single inventory key.
+    """
+
+    def __init__(self, loader, ttl, stale_ttl):
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock = threading.Lock()
+        self.has_value = False
+        self.value = None
+        self.expires = 0
+        self.generation = 0
+        self.flight = None
+
+
+class Inventory(object):
+    """
+    Thread-safe inventory of devices with single-flight refresh semantics.
+
+    Values are obtained by calling a loader function registered for a key.
+    By default, the ``'block'``, ``'net'``, ``'ubi'`` and ``'mounts'`` keys
+    are registered (see :py:data:`~DEFAULT_LOADERS`). Additional loaders can
+    be registered using the :py:meth:`~register` method.
+
+    ``ttls`` is an optional dictionary mapping keys to number of seconds a
+    loaded value is considered fresh. Keys that are not in the dictionary use
+    ``default_ttl``. ``stale_ttl`` is the number of seconds after expiry
+    during which the old value is returned immediately while a single
+    background thread refreshes it. Once that window passes as well, callers
+    block until a fresh value is available. Setting ``stale_ttl`` to 0
+    disables stale-while-revalidate behavior.
+
+    Example::
+
+        >>> inv = Inventory(ttls={'block': 10, 'net': 2})
+        >>> inv.get('block')
+        [<hwd.storage.Disk object at 0x7f...>]
+    """
+
+    def __init__(self, ttls=None, default_ttl=DEFAULT_TTL,
+                 stale_ttl=DEFAULT_STALE_TTL, loaders=DEFAULT_LOADERS):
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        for key, loader in loaders.items():
+            self.register(key, loader)
+
+    def register(self, key, loader, ttl=None, stale_ttl=None):
+        """
+        Register a ``loader`` function for given ``key``. The loader is called
+        without arguments and its return value is cached. ``ttl`` and
+        ``stale_ttl`` override the inventory-wide values for this key only.
+        Registering a loader for an existing key replaces it and discards any
+        cached value.
+        """
+        if ttl is None:
+            ttl = self.ttls.get(key, self.default_ttl)
+        if stale_ttl is None:
+            stale_ttl = self.stale_ttl
+        with self._lock:
+            self._entries[key] = _Entry(loader, ttl, stale_ttl)
+
+    def _entry(self, key):
+        try:
+            return self._entries[key]
+        except KeyError:
+            raise KeyError('No loader registered for {}'.format(key))
+
+    def get(self, key):
+        """
+        Return the cached value for ``key``, refreshing it if necessary. If
+        the loader raises an exception, the exception is propagated to all
+        threads that were waiting for that particular refresh.
+        """
+        entry = self._entry(key)
+        now = clock()
+        with entry.lock:
+            if entry.has_value and now < entry.expires:
+                return entry.value
+            stale_ok = (entry.has_value and
+                        now < entry.expires + entry.stale_ttl)
+            flight = entry.flight
+            if flight is None:
+                flight = entry.flight = _Flight(entry.generation)
+                owner = True
+            else:
+                owner = False
+            if stale_ok:
+                value = entry.value
+        if stale_ok:
+            if owner:
+                t = threading.Thread(target=self._refresh,
+                                     args=(entry, flight))
+                t.daemon = True
+                t.start()
+            return value
+        if owner:
+            self._refresh(entry, flight)
+        return flight.wait()
+
+    def _refresh(self, entry, flight):
+        """
+        Call the loader for ``entry`` and publish the result through both the
+        entry and the ``flight``.
+        """
+        try:
+            value = entry.loader()
+        except Exception as exc:
+            with entry.lock:
+                if entry.flight is flight:
+                    entry.flight = None
+            flight.error = exc
+            flight.done.set()
+            return
+        with entry.lock:
+            # Values loaded before an invalidation are handed to the threads
+            # that were waiting for them, but are not cached.
+            if flight.generation == entry.generation:
+                entry.value = value
+                entry.has_value = True
+                entry.expires = clock() + entry.ttl
+            if entry.flight is flight:
+                entry.flight = None
+        flight.value = value
+        flight.done.set()
+
+    def invalidate(self, key=None):
+        """
+        Mark the value for ``key`` as expired, or values for all keys if
+        ``key`` is omitted. Invalidated values are never served as stale
+        values, so the next call to :py:meth:`~get` blocks until a fresh value
+        is loaded. This is intended to be called from udev event handlers.
+        """
+        keys = [key] if key is not None else list(self._entries)
+        for k in keys:
+            entry = self._entry(k)
+            with entry.lock:
+                entry.has_value = False
+                entry.value = None
+                entry.generation += 1
+                entry.flight = None
+
+    def disks(self):
+        """
+        Return a list of :py:class:`~hwd.storage.Disk` objects.
+        """
+        return self.get('block')
+
+    def ifaces(self):
+        """
+        Return a list of :py:class:`~hwd.network.NetIface` objects.
+        """
+        return self.get('net')
+
+    def ubi_volumes(self):
+        """
+        Return a list of :py:class:`~hwd.storage.UbiVolume` objects.
+        """
+        return self.get('ubi')
+
+    def mounts(self):
+        """
+        Return a list of :py:class:`~hwd.storage.MtabEntry` objects.
+        """
+        return self.get('mounts')
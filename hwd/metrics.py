@@ -0,0 +1,312 @@
+"""
+Prometheus metrics exporter.
+
+Storage and network metrics are rendered in the Prometheus text exposition
+format. Rendered output is cached for a configurable interval, and
+concurrent scrapes during a refresh wait for that refresh rather than
+starting their own (see :py:class:`~hwd.inventory.Inventory`), so the number
+of scrapers does not affect the load on sysfs.
+
+Metrics can be served over HTTP::
+
+    hwd metrics --listen 127.0.0.1:9101
+
+or written to a file for the node exporter's textfile collector::
+
+    hwd metrics --textfile /var/lib/node_exporter/hwd.prom --interval 30
+"""
+
+import os
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from . import inventory
+from . import network
+from . import records
+from . import storage
+
+#: Content type of the text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+#: Default number of seconds rendered metrics are cached
+DEFAULT_TTL = 10
+
+#: Leading fields of the block device stat file as ``(metric, scale, help)``
+#: tuples. Scale converts sector counts to bytes and milliseconds to seconds.
+BLOCK_STAT_FIELDS = (
+    ('reads_completed_total', 1, 'Reads completed successfully.'),
+    ('reads_merged_total', 1, 'Reads merged.'),
+    ('read_bytes_total', storage.SECTOR_SIZE, 'Bytes read.'),
+    ('read_time_seconds_total', 0.001, 'Time spent reading.'),
+    ('writes_completed_total', 1, 'Writes completed successfully.'),
+    ('writes_merged_total', 1, 'Writes merged.'),
+    ('written_bytes_total', storage.SECTOR_SIZE, 'Bytes written.'),
+    ('write_time_seconds_total', 0.001, 'Time spent writing.'),
+    ('io_now', 1, 'I/Os currently in progress.'),
+    ('io_time_seconds_total', 0.001, 'Time spent doing I/Os.'),
+)
+
+#: Network interface statistics that are exported
+NET_STAT_FIELDS = (
+    ('rx_bytes', 'receive_bytes_total', 'Bytes received.'),
+    ('tx_bytes', 'transmit_bytes_total', 'Bytes transmitted.'),
+    ('rx_packets', 'receive_packets_total', 'Packets received.'),
+    ('tx_packets', 'transmit_packets_total', 'Packets transmitted.'),
+    ('rx_errors', 'receive_errors_total', 'Receive errors.'),
+    ('tx_errors', 'transmit_errors_total', 'Transmit errors.'),
+    ('rx_dropped', 'receive_drop_total', 'Received packets dropped.'),
+    ('tx_dropped', 'transmit_drop_total', 'Transmitted packets dropped.'),
+)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as fd:
+            return fd.read().strip()
+    except (OSError, IOError):
+        return None
+
+
+def _size(value):
+    # Wrappers report unknown sizes as negative numbers
+    return value if value is not None and value >= 0 else None
+
+
+class MetricSet(object):
+    """
+    Collects samples and renders them in the text exposition format. Samples
+    of the same metric are grouped under a single HELP and TYPE header
+    regardless of the order in which they are added.
+    """
+
+    def __init__(self, prefix='hwd_'):
+        self.prefix = prefix
+        self._metrics = {}
+        self._order = []
+
+    def add(self, name, value, labels=None, help='', kind='gauge'):
+        """
+        Add a sample for metric ``name`` with optional ``labels`` dict.
+        Samples whose value is ``None`` are ignored.
+        """
+        if value is None:
+            return
+        name = self.prefix + name
+        if name not in self._metrics:
+            self._metrics[name] = (help, kind, [])
+            self._order.append(name)
+        self._metrics[name][2].append((labels or {}, value))
+
+    def render(self):
+        """
+        Return the metrics as a UTF-8 encoded string.
+        """
+        lines = []
+        for name in self._order:
+            help, kind, samples = self._metrics[name]
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, value in samples:
+                if labels:
+                    label_str = '{' + ','.join(
+                        '{}="{}"'.format(k, _escape(v))
+                        for k, v in sorted(labels.items())) + '}'
+                else:
+                    label_str = ''
+                lines.append('{}{} {}'.format(name, label_str, value))
+        lines.append('')
+        return '\n'.join(lines).encode('utf-8')
+
+
+def add_block_stats(metrics, kind, name, sys_path):
+    """
+    Add I/O counters of the block device at ``sys_path`` to ``metrics``.
+    """
+    stat = _read(os.path.join(sys_path, 'stat'))
+    if not stat:
+        return
+    for (metric, scale, help), value in zip(BLOCK_STAT_FIELDS, stat.split()):
+        mtype = 'counter' if metric.endswith('_total') else 'gauge'
+        metrics.add('{}_{}'.format(kind, metric), int(value) * scale,
+                    {'device': name}, help, mtype)
+
+
+def add_storage_metrics(metrics, data):
+    """
+    Add storage metrics for records in ``data`` (see
+    :py:func:`~hwd.records.collect`) to ``metrics``. Sizes that are not known
+    are left out.
+    """
+    parts = []
+    for disk in data['disks']:
+        labels = {'device': disk['name'], 'bus': disk['bus'] or '',
+                  'removable': str(disk['is_removable']).lower()}
+        metrics.add('disk_size_bytes', _size(disk['size']), labels,
+                    'Disk capacity in bytes.')
+        add_block_stats(metrics, 'disk', disk['name'], disk['system_path'])
+        parts.extend((p, disk['name']) for p in disk['partitions'])
+    parts.extend((v, '') for v in data['ubi'])
+    for part, disk_name in parts:
+        metrics.add('partition_size_bytes', _size(part['size']),
+                    {'device': part['name'], 'disk': disk_name},
+                    'Partition capacity in bytes.')
+        if disk_name:
+            add_block_stats(metrics, 'partition', part['name'],
+                            part['system_path'])
+        stat = part['stat']
+        if not stat:
+            continue
+        labels = {'device': part['name'], 'fstype': part['format'] or '',
+                  'mountpoint': part['mount_points'][-1]}
+        metrics.add('filesystem_size_bytes', stat['total'], labels,
+                    'Filesystem size in bytes.')
+        metrics.add('filesystem_used_bytes', stat['used'], labels,
+                    'Filesystem space used in bytes.')
+        metrics.add('filesystem_free_bytes', stat['free'], labels,
+                    'Filesystem space available in bytes.')
+
+
+def add_network_metrics(metrics, data):
+    """
+    Add network metrics for records in ``data`` (see
+    :py:func:`~hwd.records.collect`) to ``metrics``.
+    """
+    wireless = network.wireless_stats()
+    for iface in data['ifaces']:
+        name = iface['name']
+        labels = {'interface': name}
+        metrics.add('network_carrier', int(iface['is_connected']), labels,
+                    'Whether the interface has carrier.')
+        metrics.add('network_info', 1, dict(
+            labels, type=iface['type'] or '', mac=iface['mac'] or ''),
+            'Network interface information.')
+        for family in ('ipv4', 'ipv6'):
+            addr = iface[family + 'addr']
+            if addr:
+                metrics.add('network_address_info', 1, dict(
+                    labels, family=family, address=addr,
+                    netmask=iface[family + 'netmask'] or ''),
+                    'Addresses assigned to the interface.')
+        stats = wireless.get(name)
+        if stats:
+            metrics.add('wireless_link_quality', stats.link, labels,
+                        'Wireless link quality.')
+            metrics.add('wireless_signal_level', stats.level, labels,
+                        'Wireless signal level.')
+            metrics.add('wireless_noise_level', stats.noise, labels,
+                        'Wireless noise level.')
+        stats_dir = os.path.join(iface['system_path'], 'statistics')
+        for fname, metric, help in NET_STAT_FIELDS:
+            value = _read(os.path.join(stats_dir, fname))
+            if value is not None:
+                metrics.add('network_' + metric, int(value), labels, help,
+                            'counter')
+
+
+def render(inv=None):
+    """
+    Collect the inventory and return all metrics in text exposition format.
+    ``inv`` is an optional :py:class:`~hwd.inventory.Inventory` object used
+    to obtain the devices.
+    """
+    data = records.collect(inv)
+    metrics = MetricSet()
+    add_storage_metrics(metrics, data)
+    add_network_metrics(metrics, data)
+    metrics.add('scrape_timestamp_seconds', round(time.time(), 3), None,
+                'Time at which the metrics were collected.')
+    return metrics.render()
+
+
+class Exporter(object):
+    """
+    Renders metrics at most once every ``ttl`` seconds, no matter how many
+    threads ask for them. Devices are enumerated through an
+    :py:class:`~hwd.inventory.Inventory` whose values live for the same
+    interval.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.devices = inventory.Inventory(default_ttl=ttl)
+        # Stale output is never served, since each scrape should reflect
+        # the state at most ``ttl`` seconds old.
+        self._cache = inventory.Inventory(
+            default_ttl=ttl, stale_ttl=0,
+            loaders={'metrics': lambda: render(self.devices)})
+
+    def render(self):
+        """
+        Return cached metrics, refreshing them if they expired.
+        """
+        return self._cache.get('metrics')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves metrics on ``/metrics``.
+    """
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        try:
+            body = self.server.exporter.render()
+        except Exception as exc:
+            self.send_error(500, str(exc))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+    """
+    HTTP server that serves metrics from ``exporter``, an
+    :py:class:`~Exporter` object, on ``address``, a ``(host, port)`` tuple.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, exporter, address):
+        self.exporter = exporter
+        HTTPServer.__init__(self, address, MetricsHandler)
+
+
+def write_textfile(path, exporter):
+    """
+    Atomically write metrics from ``exporter`` to ``path``. The file is
+    written under a temporary name and renamed, so the textfile collector
+    never reads a partially written file.
+    """
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as fd:
+        fd.write(exporter.render())
+    os.rename(tmp, path)
+
+
+def write_textfile_forever(path, interval=DEFAULT_TTL):
+    """
+    Write metrics to ``path`` every ``interval`` seconds. This function does
+    not return.
+    """
+    exporter = Exporter(interval)
+    while True:
+        write_textfile(path, exporter)
+        time.sleep(interval)
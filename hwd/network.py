@@ -1,7 +1,80 @@
+import threading
+from collections import deque, namedtuple
+
 import netifaces
 
 from . import udev
 from . import wrapper
+from .compat import clock
+
+#: Path of the wireless statistics table
+WIRELESS_PATH = '/proc/net/wireless'
+
+#: Number of seconds wireless statistics read by :py:func:`~wireless_stats`
+#: are reused before the table is read again
+WIRELESS_TTL = 1
+
+#: namedtuple representing wireless link metrics of a single interface.
+#: ``link`` is link quality, and ``level`` and ``noise`` are signal and noise
+#: levels (in dBm on most drivers). ``discarded`` is the total number of
+#: discarded packets, and ``missed_beacons`` the number of missed beacons.
+WirelessStats = namedtuple('WirelessStats', ['link', 'level', 'noise',
+                                             'discarded', 'missed_beacons'])
+
+_wireless_cache = (None, {})
+_wireless_lock = threading.Lock()
+
+
+def _wireless_value(s):
+    # Values that were not updated since last read are suffixed with a dot
+    return float(s.rstrip('.'))
+
+
+def read_wireless_stats(path=WIRELESS_PATH):
+    """
+    Read /proc/net/wireless and return a dict mapping interface names to
+    :py:class:`~WirelessStats` objects. Returns an empty dict if the table
+    cannot be read (e.g., there are no wireless extensions in the kernel).
+    """
+    stats = {}
+    try:
+        with open(path, 'r') as fd:
+            lines = fd.readlines()[2:]
+    except (OSError, IOError):
+        return stats
+    for l in lines:
+        name, _, values = l.partition(':')
+        fields = values.split()
+        if len(fields) < 10:
+            continue
+        try:
+            stats[name.strip()] = WirelessStats(
+                _wireless_value(fields[1]),
+                _wireless_value(fields[2]),
+                _wireless_value(fields[3]),
+                sum(int(f) for f in fields[4:9]),
+                int(fields[9]))
+        except ValueError:
+            continue
+    return stats
+
+
+def wireless_stats(max_age=WIRELESS_TTL):
+    """
+    Return wireless statistics for all interfaces as returned by
+    :py:func:`~read_wireless_stats`. The table is read at most once every
+    ``max_age`` seconds, so looking up metrics for several interfaces or
+    properties in quick succession only reads it once.
+    """
+    global _wireless_cache
+    now = clock()
+    with _wireless_lock:
+        read_at, stats = _wireless_cache
+        if read_at is not None and now - read_at < max_age:
+            return stats
+        stats = read_wireless_stats()
+        _wireless_cache = (now, stats)
+        return stats
 
 
 class NetIface(wrapper.Wrapper):
@@ -24,6 +97,39 @@ class NetIface(wrapper.Wrapper):
         else:
             return self.device.device_type
 
+    @property
+    def wireless(self):
+        """
+        Wireless link metrics as :py:class:`~WirelessStats`, or ``None`` if
+        the NIC is not a wireless device. Metrics are obtained using
+        :py:func:`~wireless_stats`.
+        """
+        return wireless_stats().get(self.name)
+
+    @property
+    def link_quality(self):
+        """
+        Wireless link quality, or ``None`` for devices that are not wireless.
+        """
+        stats = self.wireless
+        return stats.link if stats else None
+
+    @property
+    def signal_level(self):
+        """
+        Wireless signal level, or ``None`` for devices that are not wireless.
+        """
+        stats = self.wireless
+        return stats.level if stats else None
+
+    @property
+    def noise_level(self):
+        """
+        Wireless noise level, or ``None`` for devices that are not wireless.
+        """
+        stats = self.wireless
+        return stats.noise if stats else None
+
     @property
     def mac(self):
         """
@@ -117,3 +223,95 @@ class NetIface(wrapper.Wrapper):
         IPv6 default gateway.
         """
         return self._get_default_gateway(6)
+
+
+class WirelessSampler(object):
+    """
+    Periodically samples wireless metrics for all interfaces with a single
+    read of /proc/net/wireless per sample.
+
+    For each interface, the sampler keeps an exponentially weighted moving
+    average of the metrics (``alpha`` is the weight of the newest sample),
+    and the last ``size`` raw samples.
+
+    Example::
+
+        >>> sampler = WirelessSampler(interval=2)
+        >>> sampler.start()
+        >>> sampler.smoothed('wlan0').level
+        -57.4
+        >>> [s.level for s in sampler.history('wlan0')]
+        [-56.0, -58.0, -57.0]
+    """
+
+    def __init__(self, interval=1, size=60, alpha=0.3):
+        self.interval = interval
+        self.size = size
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._smoothed = {}
+        self._history = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        """
+        Take a single sample of all interfaces.
+        """
+        stats = read_wireless_stats()
+        a = self.alpha
+        with self._lock:
+            for name, s in stats.items():
+                prev = self._smoothed.get(name)
+                if prev is None:
+                    self._smoothed[name] = s
+                else:
+                    self._smoothed[name] = WirelessStats(*[
+                        a * new + (1 - a) * old for new, old in zip(s, prev)])
+                hist = self._history.get(name)
+                if hist is None:
+                    hist = self._history[name] = deque(maxlen=self.size)
+                hist.append(s)
+            for name in set(self._smoothed) - set(stats):
+                # Interface went away or stopped being wireless
+                del self._smoothed[name]
+                del self._history[name]
+
+    def smoothed(self, name):
+        """
+        Return smoothed :py:class:`~WirelessStats` for interface ``name``, or
+        ``None`` if there are no samples for it.
+        """
+        with self._lock:
+            return self._smoothed.get(name)
+
+    def history(self, name):
+        """
+        Return a list of recent :py:class:`~WirelessStats` samples for
+        interface ``name``, oldest first.
+        """
+        with self._lock:
+            return list(self._history.get(name, ()))
+
+    def run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """
+        Start sampling in a daemon thread.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling and wait for the thread to finish.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,127 @@
+"""
+Conversion of wrapper objects to plain data records.
+
+Records are dictionaries that only contain JSON-compatible values (strings,
+numbers, booleans, ``None``, lists and dictionaries). Keys in the records
+match the names of the wrapper properties they were obtained from, so code
+written against the wrapper API can also work with the records through thin
+view objects.
+"""
+
+from . import inventory as _inventory
+from . import storage
+
+#: Properties common to all wrapped devices
+DEVICE_FIELDS = ('name', 'system_path', 'node', 'aliases', 'bus', 'vendor',
+                 'model')
+
+#: Disk-specific properties
+DISK_FIELDS = DEVICE_FIELDS + ('uuid', 'part_table_type', 'sectors', 'size',
+                               'is_read_only', 'is_removable')
+
+#: Partition-specific properties (also used for UBI volumes)
+PARTITION_FIELDS = DEVICE_FIELDS + ('number', 'label', 'usage', 'uuid',
+                                    'scheme', 'part_type', 'format',
+                                    'is_extended', 'offset', 'sectors',
+                                    'size')
+
+#: Network interface properties. Wireless link metrics are deliberately left
+#: out because they change all the time, and would make every inventory look
+#: different from the previous one (see :py:mod:`hwd.metrics` instead).
+IFACE_FIELDS = DEVICE_FIELDS + ('type', 'mac', 'is_connected', 'ipv4addr',
+                                'ipv4netmask', 'ipv4gateway', 'ipv6addr',
+                                'ipv6netmask', 'ipv6gateway')
+
+
+def _fields(obj, fields):
+    return dict((f, getattr(obj, f, None)) for f in fields)
+
+
+def _mount_points(obj, mtab):
+    """
+    Return mount points of ``obj`` found in ``mtab``, a list of
+    :py:class:`~hwd.storage.MtabEntry` objects. This is equivalent to
+    :py:attr:`~hwd.storage.Mountable.mount_points` without rereading
+    /proc/mounts for every device.
+    """
+    aliases = obj.aliases
+    return [e.mdir for e in mtab if e.dev in aliases]
+
+
+def stat_record(mount_points):
+    """
+    Return disk usage information for the last of the ``mount_points`` as a
+    dictionary of :py:class:`~hwd.storage.Fstat` fields, or ``None`` if there
+    are no mount points or usage information is not available.
+    """
+    if not mount_points:
+        return None
+    try:
+        return dict(storage.fstat(mount_points[-1])._asdict())
+    except (OSError, ZeroDivisionError):
+        return None
+
+
+def partition_record(part, mtab):
+    """
+    Return a record for a :py:class:`~hwd.storage.Partition` or
+    :py:class:`~hwd.storage.UbiVolume` object. In addition to the partition
+    properties, the record contains mount points and disk usage information
+    under ``'mount_points'`` and ``'stat'`` keys respectively.
+    """
+    rec = _fields(part, PARTITION_FIELDS)
+    rec['mount_points'] = _mount_points(part, mtab)
+    rec['stat'] = stat_record(rec['mount_points'])
+    return rec
+
+
+def disk_record(disk, mtab):
+    """
+    Return a record for a :py:class:`~hwd.storage.Disk` object. Records for
+    disk's partitions are included as a list under ``'partitions'`` key.
+    """
+    rec = _fields(disk, DISK_FIELDS)
+    rec['partitions'] = [partition_record(p, mtab) for p in disk.partitions]
+    return rec
+
+
+def iface_record(iface):
+    """
+    Return a record for a :py:class:`~hwd.network.NetIface` object.
+    """
+    return _fields(iface, IFACE_FIELDS)
+
+
+def mount_record(entry):
+    """
+    Return a record for a :py:class:`~hwd.storage.MtabEntry` object.
+    """
+    return dict(entry._asdict())
+
+
+def collect(inventory=None):
+    """
+    Return a dictionary containing records for all disks (``'disks'``), UBI
+    volumes (``'ubi'``), network interfaces (``'ifaces'``) and mount table
+    entries (``'mounts'``).
+
+    If ``inventory`` is passed, it should be a
+    :py:class:`~hwd.inventory.Inventory` object, and devices are obtained
+    from it instead of enumerating them through udev.
+    """
+    if inventory is not None:
+        disks = inventory.disks()
+        ubi = inventory.ubi_volumes()
+        ifaces = inventory.ifaces()
+        mtab = inventory.mounts()
+    else:
+        disks = _inventory.load_disks()
+        ubi = _inventory.load_ubi()
+        ifaces = _inventory.load_ifaces()
+        mtab = _inventory.load_mounts()
+    return {
+        'disks': [disk_record(d, mtab) for d in disks],
+        'ubi': [partition_record(v, mtab) for v in ubi],
+        'ifaces': [iface_record(i) for i in ifaces],
+        'mounts': [mount_record(e) for e in mtab],
+    }
@@ -0,0 +1,318 @@
+"""
+Shared, memory-mapped inventory snapshots.
+
+A single producer process periodically writes the inventory (see
+:py:func:`~hwd.records.collect`) to a memory-mapped file, and any number of
+consumer processes read it without talking to udev at all. Consumers obtain
+view objects that expose the same properties as the
+:py:class:`~hwd.storage.Disk`, :py:class:`~hwd.storage.Partition`,
+:py:class:`~hwd.storage.UbiVolume` and :py:class:`~hwd.network.NetIface`
+wrappers.
+
+The file contains a header followed by two equally sized slots. The header
+holds a generation counter. The producer writes each new snapshot into the
+slot that readers are not using, and publishes it by incrementing the
+generation counter (seqlock-style double buffering). The counter is odd while
+a write is in progress. Readers never take locks: they read the counter, copy
+the payload out of the active slot, and retry if the counter shows that the
+slot was overwritten in the meantime.
+
+Reading snapshots does not require pyudev or netifaces. Those are only
+imported by :py:meth:`SnapshotWriter.publish`.
+"""
+
+import fcntl
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from .structs import Fstat, MtabEntry
+
+#: Default location of the snapshot file
+DEFAULT_PATH = '/run/hwd.snapshot'
+
+#: Default capacity of a single slot in bytes
+DEFAULT_SLOT_SIZE = 1024 * 1024
+
+MAGIC = b'HWDS'
+FORMAT_VERSION = 1
+
+# magic, format version, slot size, generation
+HEADER = struct.Struct('<4sIQQ')
+# payload length, payload CRC32
+SLOT_HEADER = struct.Struct('<QI')
+GENERATION_OFFSET = 16
+
+#: Number of times a reader retries before giving up on a snapshot that keeps
+#: being overwritten
+MAX_RETRIES = 100
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot file is missing, invalid, or cannot be read.
+    """
+    pass
+
+
+def _slot_offset(generation, slot_size):
+    """
+    Return the file offset of the slot holding the stable snapshot published
+    with given (even) ``generation``.
+    """
+    index = (generation // 2) % 2
+    return HEADER.size + index * (SLOT_HEADER.size + slot_size)
+
+
+class RecordView(object):
+    """
+    Read-only attribute access to a record dictionary. Accessing a name that
+    is not in the record raises ``AttributeError``, just like accessing a
+    missing property on a wrapper would.
+    """
+
+    def __init__(self, record):
+        self._record = record
+
+    def __getattr__(self, name):
+        try:
+            return self._record[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__,
+                                self._record.get('name'))
+
+
+class PartitionView(RecordView):
+    """
+    View compatible with :py:class:`~hwd.storage.Partition` and
+    :py:class:`~hwd.storage.UbiVolume` wrappers.
+    """
+
+    def __init__(self, record, disk=None):
+        super(PartitionView, self).__init__(record)
+        self.disk = disk
+
+    @property
+    def stat(self):
+        """
+        Disk usage as :py:class:`~hwd.storage.Fstat` at the time the snapshot
+        was taken, or ``None`` if not available.
+        """
+        stat = self._record.get('stat')
+        if stat is None:
+            return None
+        return Fstat(**stat)
+
+
+class DiskView(RecordView):
+    """
+    View compatible with :py:class:`~hwd.storage.Disk` wrapper.
+    """
+
+    def __init__(self, record):
+        super(DiskView, self).__init__(record)
+        self.partitions = [PartitionView(p, self)
+                           for p in record['partitions']]
+
+
+class NetIfaceView(RecordView):
+    """
+    View compatible with :py:class:`~hwd.network.NetIface` wrapper.
+    """
+    pass
+
+
+class Snapshot(object):
+    """
+    Inventory snapshot read from a snapshot file. The ``generation`` attribute
+    identifies the snapshot, and the ``disks``, ``ubi``, ``ifaces`` and
+    ``mounts`` attributes contain view objects.
+    """
+
+    def __init__(self, generation, data):
+        self.generation = generation
+        self.data = data
+        self.disks = [DiskView(d) for d in data['disks']]
+        self.ubi = [PartitionView(v) for v in data['ubi']]
+        self.ifaces = [NetIfaceView(i) for i in data['ifaces']]
+        self.mounts = [MtabEntry(**m) for m in data['mounts']]
+
+
+class SnapshotWriter(object):
+    """
+    Writes snapshots to the file at ``path``. The file is created if it does
+    not exist. ``slot_size`` is the maximum size of the encoded snapshot.
+
+    Only one writer can write to a file at a time. The file is not modified
+    until the writer holds an exclusive lock on it. Processes that compete
+    for the producer role can call :py:meth:`~try_lock`, and only the one for
+    which it returns ``True`` should write. Otherwise, the first call to
+    :py:meth:`~write` waits for the lock.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, slot_size=DEFAULT_SLOT_SIZE):
+        self.path = path
+        self.slot_size = slot_size
+        self.generation = None
+        self._map = None
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _setup(self):
+        """
+        Take the lock if not already held, and prepare the file for writing.
+        """
+        if self._map is not None:
+            return
+        # Blocks only if another writer holds the lock
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        slot_size = self.slot_size
+        size = HEADER.size + 2 * (SLOT_HEADER.size + slot_size)
+        generation = 0
+        if os.fstat(self._fd).st_size == size:
+            header = os.read(self._fd, HEADER.size)
+            magic, version, old_slot_size, generation = HEADER.unpack(header)
+            if (magic, version, old_slot_size) != (MAGIC, FORMAT_VERSION,
+                                                   slot_size):
+                generation = 0
+        else:
+            os.ftruncate(self._fd, size)
+        # An odd generation means the previous writer died while writing.
+        # Step back to the last stable generation, which points at the last
+        # completely written slot.
+        generation -= generation % 2
+        self._map = mmap.mmap(self._fd, size)
+        self._map[:HEADER.size] = HEADER.pack(MAGIC, FORMAT_VERSION,
+                                              slot_size, generation)
+        self.generation = generation
+
+    def try_lock(self):
+        """
+        Attempt to take an exclusive advisory lock on the snapshot file
+        without blocking. Returns ``True`` if this writer holds the lock.
+        The lock is released when the writer is closed or the process exits.
+        """
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (OSError, IOError):
+            return False
+        self._setup()
+        return True
+
+    def _set_generation(self, generation):
+        self._map[GENERATION_OFFSET:HEADER.size] = struct.pack('<Q',
+                                                               generation)
+        self.generation = generation
+
+    def write(self, data):
+        """
+        Encode ``data`` (normally the return value of
+        :py:func:`~hwd.records.collect`) and publish it as the next
+        generation. Returns the new generation number. Raises ``ValueError``
+        if the encoded data does not fit in a slot.
+        """
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        if len(payload) > self.slot_size:
+            raise ValueError('Snapshot of {} bytes does not fit in {} byte '
+                             'slot'.format(len(payload), self.slot_size))
+        self._setup()
+        stable = self.generation
+        offset = _slot_offset(stable + 2, self.slot_size)
+        self._set_generation(stable + 1)
+        start = offset + SLOT_HEADER.size
+        self._map[offset:start] = SLOT_HEADER.pack(
+            len(payload), zlib.crc32(payload) & 0xffffffff)
+        self._map[start:start + len(payload)] = payload
+        self._set_generation(stable + 2)
+        return self.generation
+
+    def publish(self, inventory=None):
+        """
+        Collect the inventory and write it. ``inventory`` is passed to
+        :py:func:`~hwd.records.collect`.
+        """
+        from . import records
+        return self.write(records.collect(inventory))
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        os.close(self._fd)
+
+
+class SnapshotReader(object):
+    """
+    Reads snapshots from the file at ``path`` without taking any locks.
+
+    Decoded snapshots are cached, so calling :py:meth:`~read` repeatedly is
+    cheap as long as the generation has not changed.
+
+    Example::
+
+        >>> reader = SnapshotReader()
+        >>> snap = reader.read()
+        >>> [p.mount_points for d in snap.disks for p in d.partitions]
+        [['/boot'], ['/'], []]
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._snapshot = None
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError as exc:
+            raise SnapshotError('Cannot open {}: {}'.format(path, exc))
+        try:
+            self._map = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error) as exc:
+            raise SnapshotError('Cannot map {}: {}'.format(path, exc))
+        finally:
+            os.close(fd)
+        magic, version, self.slot_size, _ = HEADER.unpack(
+            self._map[:HEADER.size])
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError('{} is not a snapshot file'.format(path))
+
+    @property
+    def generation(self):
+        """
+        Current generation counter. Odd value means a write is in progress.
+        """
+        return struct.unpack('<Q', self._map[GENERATION_OFFSET:HEADER.size])[0]
+
+    def _read_payload(self):
+        for _ in range(MAX_RETRIES):
+            before = self.generation
+            stable = before - before % 2
+            if stable == 0:
+                raise SnapshotError('No snapshot published yet')
+            if self._snapshot and self._snapshot.generation == stable:
+                return stable, None
+            offset = _slot_offset(stable, self.slot_size)
+            start = offset + SLOT_HEADER.size
+            length, crc = SLOT_HEADER.unpack(self._map[offset:start])
+            payload = self._map[start:start + min(length, self.slot_size)]
+            # The slot holding the stable generation is only overwritten
+            # once the writer starts on the generation after the next one.
+            if self.generation < stable + 3 and (
+                    zlib.crc32(payload) & 0xffffffff) == crc:
+                return stable, payload
+        raise SnapshotError('Snapshot kept changing while being read')
+
+    def read(self):
+        """
+        Return the latest :py:class:`~Snapshot`. Raises
+        :py:class:`~SnapshotError` if nothing was published yet.
+        """
+        generation, payload = self._read_payload()
+        if payload is not None:
+            data = json.loads(payload.decode('utf-8'))
+            self._snapshot = Snapshot(generation, data)
+        return self._snapshot
+
+    def close(self):
+        self._map.close()
@@ -0,0 +1,231 @@
+"""
+Disk space threshold watcher.
+
+:py:class:`~SpaceWatcher` monitors free space on mounted partitions (any
+object that implements the :py:class:`~hwd.storage.Mountable` interface) and
+invokes a callback when free space crosses a threshold. Rather than checking
+all partitions at a fixed interval, each partition is checked more often the
+closer it gets to its threshold, and all partitions are checked immediately
+whenever something is mounted or unmounted.
+"""
+
+from __future__ import division
+
+import logging
+import os
+import select
+import threading
+from collections import namedtuple
+
+from . import storage
+from .compat import clock
+
+#: Shortest interval between checks of a single partition, in seconds
+MIN_INTERVAL = 1
+
+#: Longest interval between checks of a single partition, in seconds
+MAX_INTERVAL = 60
+
+#: Distance from the threshold (in percentage points) at which partitions are
+#: checked at the longest interval
+SPAN = 20
+
+#: Event states
+LOW = 'low'
+OK = 'ok'
+
+#: namedtuple representing a threshold crossing. ``state`` is either
+#: :py:data:`~LOW` (free space dropped below the threshold) or
+#: :py:data:`~OK` (free space recovered above threshold plus hysteresis).
+#: ``stat`` is the :py:class:`~hwd.storage.Fstat` that caused the event.
+SpaceEvent = namedtuple('SpaceEvent', ['mountable', 'threshold', 'state',
+                                       'stat'])
+
+log = logging.getLogger(__name__)
+
+
+class _Watch(object):
+
+    def __init__(self, mountable, threshold, hysteresis):
+        self.mountable = mountable
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.state = None
+        self.last = None
+        self.last_time = None
+        self.due = 0
+
+    def evaluate(self, stat):
+        """
+        Return new state for given stat, taking hysteresis into account.
+        """
+        if stat.pct_free < self.threshold:
+            return LOW
+        if (self.state == LOW and
+                stat.pct_free < self.threshold + self.hysteresis):
+            return LOW
+        return OK
+
+    def interval(self, stat, now, min_interval, max_interval):
+        """
+        Return number of seconds until the next check. The interval shrinks
+        as free space approaches the threshold (or the recovery level when
+        in the low state), and is further limited to half of the estimated
+        time it takes to reach that level at the current rate of change.
+        """
+        if stat is None:
+            return max_interval
+        if self.state == LOW:
+            target = self.threshold + self.hysteresis
+            distance = target - stat.pct_free
+        else:
+            target = self.threshold
+            distance = stat.pct_free - target
+        distance = max(0, min(distance, SPAN))
+        interval = (min_interval +
+                    (max_interval - min_interval) * distance / SPAN)
+        if self.last is not None and now > self.last_time:
+            rate = (stat.free - self.last.free) / (now - self.last_time)
+            remaining = stat.free - stat.total * target / 100
+            # Only consider the rate when free space is moving towards the
+            # target level.
+            if rate and (remaining > 0) == (rate < 0):
+                interval = min(interval, abs(remaining / rate) / 2)
+        return max(min_interval, interval)
+
+
+class SpaceWatcher(object):
+    """
+    Watches free space on mountable devices and calls ``callback`` with a
+    :py:class:`~SpaceEvent` object when free space crosses a threshold.
+
+    ``min_interval`` and ``max_interval`` limit how often each partition is
+    checked. The callback is invoked from the watcher thread; exceptions it
+    raises are logged and do not stop the watcher.
+
+    Example::
+
+        >>> def on_space(event):
+        ...     if event.state == space.LOW:
+        ...         pause_downloads()
+        ...     else:
+        ...         resume_downloads()
+        >>> watcher = space.SpaceWatcher(on_space)
+        >>> watcher.watch(partition, threshold=10, hysteresis=5)
+        >>> watcher.start()
+    """
+
+    def __init__(self, callback, min_interval=MIN_INTERVAL,
+                 max_interval=MAX_INTERVAL):
+        self.callback = callback
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._watches = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wake_r, self._wake_w = os.pipe()
+
+    def watch(self, mountable, threshold, hysteresis=2):
+        """
+        Start watching ``mountable``. A :py:data:`~LOW` event is emitted when
+        its ``pct_free`` drops below ``threshold``, and an :py:data:`~OK`
+        event when it rises to ``threshold + hysteresis`` or above. The first
+        check always emits an event with the current state.
+        """
+        with self._lock:
+            self._watches.append(_Watch(mountable, threshold, hysteresis))
+        self._wake()
+
+    def unwatch(self, mountable):
+        """
+        Stop watching ``mountable``.
+        """
+        with self._lock:
+            self._watches = [w for w in self._watches
+                             if w.mountable is not mountable]
+
+    def _wake(self):
+        os.write(self._wake_w, b'x')
+
+    def check(self, watch, now):
+        """
+        Check a single watch, emit an event if its state changed, and
+        schedule the next check.
+        """
+        try:
+            stat = watch.mountable.stat
+        except (OSError, ZeroDivisionError):
+            stat = None
+        if stat is not None:
+            state = watch.evaluate(stat)
+            if state != watch.state:
+                watch.state = state
+                try:
+                    self.callback(SpaceEvent(watch.mountable, watch.threshold,
+                                             state, stat))
+                except Exception:
+                    # A broken callback must not kill the watcher thread
+                    log.exception('Error in space watcher callback')
+        watch.due = now + watch.interval(stat, now, self.min_interval,
+                                         self.max_interval)
+        watch.last = stat
+        watch.last_time = now
+
+    def check_all(self):
+        """
+        Check all watched devices immediately.
+        """
+        now = clock()
+        with self._lock:
+            watches = list(self._watches)
+        for w in watches:
+            self.check(w, now)
+
+    def run(self):
+        """
+        Run the watcher loop until :py:meth:`~stop` is called. This is
+        normally invoked through :py:meth:`~start`.
+        """
+        mounts = storage.MountMonitor()
+        try:
+            while True:
+                now = clock()
+                with self._lock:
+                    watches = list(self._watches)
+                timeout = max(0, min([w.due for w in watches] or
+                                     [now + self.max_interval]) - now)
+                readable, _, exceptional = select.select(
+                    [self._wake_r], [], [mounts], timeout)
+                # New watches are due immediately, so waking up is enough
+                # to have them checked, unless we are asked to quit.
+                if readable and b'q' in os.read(self._wake_r, 512):
+                    return
+                if exceptional and mounts.poll(timeout=0):
+                    for w in watches:
+                        w.due = 0
+                now = clock()
+                for w in watches:
+                    if w.due <= now:
+                        self.check(w, now)
+        finally:
+            mounts.close()
+
+    def start(self):
+        """
+        Start the watcher loop in a daemon thread.
+        """
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the watcher loop, wait for the thread to finish, and close the
+        pipe used to wake it. A stopped watcher cannot be started again.
+        """
+        os.write(self._wake_w, b'q')
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        os.close(self._wake_r)
+        os.close(self._wake_w)
@@ -1,20 +1,87 @@
 from __future__ import division
 
+import json
+import logging
 import os
+import select
+import threading
 from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from stat import S_ISDIR
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 from . import udev
 from . import wrapper
+from .compat import clock
+from .structs import Fstat, MtabEntry
 
+#: Unit in which the kernel and udev report sizes and offsets. This is always
+#: 512 bytes regardless of the device's actual block size (see
+#: :py:attr:`Disk.queue` for that).
 SECTOR_SIZE = 512
 
+#: Location of UBI devices in sysfs
+UBI_SYSFS = '/sys/class/ubi'
+
+#: Number of seconds UBI attributes (counters, volume sizes and names) read
+#: by :py:func:`ubi_topology` are reused before they are read again
+UBI_TTL = 1
+
+#: Location of block devices in sysfs
+BLOCK_SYSFS = '/sys/class/block'
+
+log = logging.getLogger(__name__)
+
+
+#: namedtuple representing block device queue characteristics. Sizes are in
+#: bytes, except for ``max_sectors_kb`` and ``max_hw_sectors_kb`` which are in
+#: KiB. ``alignment_offset`` is the number of bytes the beginning of the
+#: device is offset from its natural alignment. ``scheduler`` is the active
+#: I/O scheduler, and ``rotational`` is ``True`` for spinning disks.
+QueueInfo = namedtuple('QueueInfo', ['logical_block_size',
+                                     'physical_block_size',
+                                     'minimum_io_size', 'optimal_io_size',
+                                     'alignment_offset', 'rotational',
+                                     'scheduler', 'max_sectors_kb',
+                                     'max_hw_sectors_kb'])
+
+#: Files read from the block device's queue directory
+QUEUE_ATTRS = ('logical_block_size', 'physical_block_size', 'minimum_io_size',
+               'optimal_io_size', 'rotational', 'scheduler', 'max_sectors_kb',
+               'max_hw_sectors_kb')
+
+#: namedtuple representing disk space used by a directory tree
+DirUsage = namedtuple('DirUsage', ['path', 'size', 'files'])
+
+#: Removable media states
+MEDIA_READY = 'ready'
+MEDIA_GONE = 'gone'
 
-#: namedtuple representing a single mtab entry
-MtabEntry = namedtuple('MtabEntry', ['dev', 'mdir', 'fstype', 'opts', 'cfreq',
-                                     'cpass'])
+#: Number of seconds a removable partition must go without udev events
+#: before it is considered settled
+MEDIA_DEBOUNCE = 0.5
 
-#: namedtuple representing filesystem usage statistics
-Fstat = namedtuple('Fstat', ['total', 'used', 'free', 'pct_used', 'pct_free'])
+#: namedtuple representing a removable media event. ``state`` is either
+#: :py:data:`MEDIA_READY` (partition is mounted and usable) or
+#: :py:data:`MEDIA_GONE` (partition was unmounted or removed). ``partition``
+#: is a :py:class:`Partition` object, ``mount_point`` is the mount point the
+#: event refers to, and ``stat`` is the partition's :py:class:`Fstat` for
+#: ready events and ``None`` for gone events.
+MediaEvent = namedtuple('MediaEvent', ['state', 'partition', 'mount_point',
+                                       'stat'])
+
+_ubi_cache = {}
+_ubi_lock = threading.Lock()
+# Incremented by invalidation, so that topology read before an invalidation
+# is not cached after it
+_ubi_generation = [0]
 
 
 def mounts():
@@ -27,6 +94,227 @@ def mounts():
             yield MtabEntry(*l.strip().split())
 
 
+class MountMonitor(object):
+    """
+    Detects changes to the mount table. The kernel flags /proc/mounts as
+    having an exceptional condition whenever something is mounted or
+    unmounted, so changes can be detected without rereading the table.
+
+    Objects of this class have a ``fileno()`` method, and can be passed to
+    ``select()`` (as an exceptional condition) alongside other file
+    descriptors such as udev monitors.
+    """
+
+    def __init__(self, path='/proc/mounts'):
+        self._fd = open(path, 'r')
+        self._poll = select.poll()
+        self._poll.register(self._fd, select.POLLERR | select.POLLPRI)
+        # Reading the file acknowledges any pending change
+        self._fd.read()
+
+    def fileno(self):
+        return self._fd.fileno()
+
+    def poll(self, timeout=None):
+        """
+        Wait up to ``timeout`` seconds for a change in the mount table, or
+        indefinitely if ``timeout`` is ``None``. Returns ``True`` if the
+        table has changed since the last call.
+        """
+        if timeout is not None:
+            timeout = timeout * 1000
+        if not self._poll.poll(timeout):
+            return False
+        self._fd.seek(0)
+        self._fd.read()
+        return True
+
+    def close(self):
+        self._fd.close()
+
+
+def fstat(path):
+    """
+    Return disk usage information for the filesystem mounted at ``path`` in
+    :py:class:`Fstat` format.
+    """
+    stat = os.statvfs(path)
+    free = stat.f_frsize * stat.f_bavail
+    total = stat.f_frsize * stat.f_blocks
+    used = total - free
+    used_pct = round(used / total * 100)
+    free_pct = 100 - used_pct
+    return Fstat(total, used, free, used_pct, free_pct)
+
+
+class DirScanner(object):
+    """
+    Calculates disk usage of top-level directories under ``root``.
+
+    Subtrees are scanned in parallel using ``workers`` threads. The scan
+    never leaves the filesystem ``root`` is on, and never follows symbolic
+    links. Sizes are calculated from allocated blocks, so they reflect actual
+    disk usage rather than apparent file sizes. Hard-linked files are counted
+    once for each link (like ``du -l``).
+
+    If ``cache_path`` is specified, the size of files in each directory is
+    stored in that file along with the directory's modification time. On
+    subsequent scans, directories whose modification time did not change are
+    not listed again, and their cached values are used instead.
+
+    .. note::
+        Directory modification time only changes when entries are added,
+        removed, or renamed. Files that grow in place inside an otherwise
+        unchanged directory are not picked up until the directory changes or
+        the cache is discarded.
+    """
+
+    #: Default number of worker threads
+    WORKERS = 4
+
+    #: Version of the cache file format
+    CACHE_VERSION = 1
+
+    def __init__(self, root, cache_path=None, workers=WORKERS):
+        self.root = os.path.abspath(root)
+        self.cache_path = cache_path
+        self.workers = workers
+        self.dev = os.lstat(self.root).st_dev
+        self._cache = self._load()
+
+    def _load(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, 'r') as fd:
+                data = json.load(fd)
+        except (OSError, IOError, ValueError):
+            return {}
+        if (data.get('version') != self.CACHE_VERSION or
+                data.get('root') != self.root or
+                data.get('dev') != self.dev):
+            return {}
+        return data.get('dirs', {})
+
+    def _save(self, dirs):
+        if not self.cache_path:
+            return
+        tmp = self.cache_path + '.tmp'
+        try:
+            with open(tmp, 'w') as fd:
+                json.dump({'version': self.CACHE_VERSION, 'root': self.root,
+                           'dev': self.dev, 'dirs': dirs}, fd,
+                          separators=(',', ':'))
+            os.rename(tmp, self.cache_path)
+        except (OSError, IOError):
+            # The cache is only an optimisation; an unwritable cache (e.g.
+            # read-only or full filesystem) must not lose the scan result
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def _list(self, path):
+        """
+        Return total size and number of files directly in ``path``, and a
+        list of names of its subdirectories.
+        """
+        if scandir is None:
+            return self._list_slow(path)
+        size = files = 0
+        subdirs = []
+        for entry in scandir(path):
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            size += st.st_blocks * 512
+            files += 1
+        return size, files, subdirs
+
+    def _list_slow(self, path):
+        """
+        Same as :py:meth:`~_list`, for Python versions that do not have
+        ``scandir()``, and do not have the scandir package installed.
+        """
+        size = files = 0
+        subdirs = []
+        for name in os.listdir(path):
+            try:
+                st = os.lstat(os.path.join(path, name))
+            except OSError:
+                continue
+            if S_ISDIR(st.st_mode):
+                subdirs.append(name)
+                continue
+            size += st.st_blocks * 512
+            files += 1
+        return size, files, subdirs
+
+    def _scan(self, path, dirs):
+        """
+        Return total size and number of files in the tree under ``path``.
+        Directory entries are added to ``dirs``.
+        """
+        size = files = 0
+        stack = [path]
+        while stack:
+            path = stack.pop()
+            try:
+                st = os.lstat(path)
+            except OSError:
+                continue
+            if st.st_dev != self.dev:
+                continue
+            rel = os.path.relpath(path, self.root)
+            cached = self._cache.get(rel)
+            if cached and cached[0] == st.st_mtime:
+                entry = cached
+            else:
+                try:
+                    entry = [st.st_mtime] + list(self._list(path))
+                except OSError:
+                    continue
+            dirs[rel] = entry
+            size += st.st_blocks * 512 + entry[1]
+            files += entry[2]
+            stack.extend(os.path.join(path, n) for n in entry[3])
+        return size, files
+
+    def _scan_top(self, path):
+        dirs = {}
+        size, files = self._scan(path, dirs)
+        return DirUsage(path, size, files), dirs
+
+    def scan(self):
+        """
+        Return a list of :py:class:`DirUsage` objects for each top-level
+        directory, sorted by size (largest first). Files directly in ``root``
+        are represented by an entry whose path is ``root`` itself.
+        """
+        st = os.lstat(self.root)
+        own_size, own_files, subdirs = self._list(self.root)
+        dirs = {'.': [st.st_mtime, own_size, own_files, subdirs]}
+        paths = [os.path.join(self.root, n) for n in subdirs]
+        pool = ThreadPool(self.workers)
+        try:
+            results = pool.map(self._scan_top, paths)
+        finally:
+            pool.close()
+            pool.join()
+        usage = [DirUsage(self.root, own_size, own_files)]
+        for du, subtree in results:
+            dirs.update(subtree)
+            if du.size or du.files:
+                usage.append(du)
+        self._cache = dirs
+        self._save(dirs)
+        return sorted(usage, key=lambda u: u.size, reverse=True)
+
+
 class Mountable(object):
     """
     Mixing providing interfaces for mountable storage devices.
@@ -69,13 +357,20 @@ class Mountable(object):
             mp = self.mount_points[-1]
         except IndexError:
             return None
-        stat = os.statvfs(mp)
-        free = stat.f_frsize * stat.f_bavail
-        total = stat.f_frsize * stat.f_blocks
-        used = total - free
-        used_pct = round(used / total * 100)
-        free_pct = 100 - used_pct
-        return Fstat(total, used, free, used_pct, free_pct)
+        return fstat(mp)
+
+    def dir_usage(self, cache_path=None, workers=DirScanner.WORKERS):
+        """
+        Return disk usage of top-level directories on the last mount point
+        as a list of :py:class:`DirUsage` objects, or ``None`` if the device
+        is not mounted. See :py:class:`DirScanner` for the meaning of the
+        arguments.
+        """
+        try:
+            mp = self.mount_points[-1]
+        except IndexError:
+            return None
+        return DirScanner(mp, cache_path, workers).scan()
 
 
 class PartitionBase(Mountable, wrapper.Wrapper):
@@ -94,11 +389,13 @@ class PartitionBase(Mountable, wrapper.Wrapper):
 
     @property
     def disk(self):
-        if not self.parent_class or not self.device.parent:
-            return
-        if not self._disk:
-            self._disk = self.parent_class(self.device.parent)
-        return self._disk
+        disk = self._disk
+        if disk is not None or not self.parent_class:
+            return disk
+        parent = self.device.parent
+        if not parent:
+            return None
+        return self._cached('_disk', lambda: self.parent_class(parent))
 
 
 class Disk(wrapper.Wrapper):
@@ -109,6 +406,17 @@ class Disk(wrapper.Wrapper):
     def __init__(self, dev):
         super(Disk, self).__init__(dev)
         self._partitions = None
+        self._queue = None
+
+    def refresh(self):
+        """
+        Clears the :py:attr:`~device`, :py:attr:`~partitions` and
+        :py:attr:`~queue` caches.
+        """
+        with self._lock:
+            super(Disk, self).refresh()
+            self._partitions = None
+            self._queue = None
 
     @property
     def partitions(self):
@@ -116,10 +424,8 @@ class Disk(wrapper.Wrapper):
         Iterable containing disk's partition objects. Objects in the iterable
         are :py:class:`~hwd.storage.Partition` instances.
         """
-        if not self._partitions:
-            self._partitions = [Partition(d, self)
-                                for d in self.device.children]
-        return self._partitions
+        return self._cached('_partitions', lambda: [
+            Partition(d, self) for d in self.device.children])
 
     @property
     def part_table_type(self):
@@ -173,6 +479,82 @@ class Disk(wrapper.Wrapper):
         """
         return self.device.attributes.get('removable') == '1'
 
+    def _read_queue(self):
+        path = self.system_path
+        attrs = {}
+        for name in QUEUE_ATTRS:
+            try:
+                with open(os.path.join(path, 'queue', name), 'r') as fd:
+                    attrs[name] = fd.read().strip()
+            except (OSError, IOError):
+                attrs[name] = None
+        try:
+            with open(os.path.join(path, 'alignment_offset'), 'r') as fd:
+                alignment_offset = _int(fd.read().strip(), 0)
+        except (OSError, IOError):
+            alignment_offset = 0
+        scheduler = attrs['scheduler']
+        if scheduler and '[' in scheduler:
+            # Active scheduler is the one in brackets: 'none [mq-deadline]'
+            scheduler = scheduler.split('[', 1)[1].split(']', 1)[0]
+        return QueueInfo(
+            logical_block_size=_int(attrs['logical_block_size'], SECTOR_SIZE),
+            physical_block_size=_int(attrs['physical_block_size'],
+                                     SECTOR_SIZE),
+            minimum_io_size=_int(attrs['minimum_io_size'], 0),
+            optimal_io_size=_int(attrs['optimal_io_size'], 0),
+            alignment_offset=alignment_offset,
+            rotational=attrs['rotational'] == '1',
+            scheduler=scheduler,
+            max_sectors_kb=_int(attrs['max_sectors_kb']),
+            max_hw_sectors_kb=_int(attrs['max_hw_sectors_kb']))
+
+    @property
+    def queue(self):
+        """
+        Block device queue characteristics as :py:class:`QueueInfo`. All
+        values are read from sysfs in one pass, and cached until
+        :py:meth:`~refresh` is called. Block sizes default to 512 and I/O
+        sizes to 0 when not available.
+        """
+        return self._cached('_queue', self._read_queue)
+
+    @property
+    def io_alignment(self):
+        """
+        Preferred I/O alignment in bytes. This is the optimal I/O size if the
+        device reports one, and the larger of the minimum I/O size and
+        physical block size otherwise.
+        """
+        q = self.queue
+        if q.optimal_io_size:
+            return q.optimal_io_size
+        return max(q.minimum_io_size, q.physical_block_size)
+
+    def aligned_io_size(self, size):
+        """
+        Return recommended buffer size for reads and writes of about ``size``
+        bytes. The size is rounded up to a multiple of
+        :py:attr:`~io_alignment`. If the device limits the size of a single
+        request, sizes above that limit are rounded down to a multiple of
+        the alignment that fits in one request (but never below one
+        alignment unit).
+        """
+        unit = self.io_alignment
+        aligned = max(unit, -(-size // unit) * unit)
+        max_kb = self.queue.max_sectors_kb
+        if max_kb > 0 and aligned > max_kb * 1024:
+            aligned = max(unit, (max_kb * 1024) // unit * unit)
+        return aligned
+
+    def is_offset_aligned(self, offset):
+        """
+        Whether byte ``offset`` from the start of the device is aligned to
+        :py:attr:`~io_alignment`, taking the device's alignment offset into
+        account.
+        """
+        return (offset - self.queue.alignment_offset) % self.io_alignment == 0
+
 
 
 class Partition(PartitionBase):
@@ -281,6 +663,113 @@ class Partition(PartitionBase):
         """
         return self.sectors * SECTOR_SIZE
 
+    @property
+    def is_aligned(self):
+        """
+        Whether partition start is aligned to the optimal I/O boundary of its
+        disk (see :py:attr:`Disk.io_alignment`). Evaluates to ``None`` if
+        the offset or the disk are not known.
+        """
+        disk = self.disk
+        offset = self.offset
+        if disk is None or offset < 0:
+            return None
+        return disk.is_offset_aligned(offset * SECTOR_SIZE)
+
+
+def _read_sysfs_attrs(path):
+    """
+    Return a dict mapping names of regular files in ``path`` to their
+    stripped contents. Files that cannot be read are skipped.
+    """
+    attrs = {}
+    for name in os.listdir(path):
+        fpath = os.path.join(path, name)
+        if not os.path.isfile(fpath):
+            continue
+        try:
+            with open(fpath, 'r') as fd:
+                attrs[name] = fd.read().strip()
+        except (OSError, IOError):
+            continue
+    return attrs
+
+
+def _read_ubi_attrs(path, volumes):
+    attrs = _read_sysfs_attrs(path)
+    return attrs, dict((v, _read_sysfs_attrs(os.path.join(path, v)))
+                       for v in volumes)
+
+
+def ubi_topology(name, max_age=UBI_TTL):
+    """
+    Return the topology of the UBI container with given ``name`` (e.g.,
+    ``'ubi0'``) as a two-tuple containing the container's sysfs attributes
+    and a dict mapping volume names (e.g., ``'ubi0_0'``) to volume sysfs
+    attributes. Attributes are dicts of strings.
+
+    The list of volumes in a container is cached until
+    :py:func:`~invalidate_ubi_topology` is called. Attributes, which include
+    counters that change at any time (e.g., ``max_ec`` and
+    ``bad_peb_count``), are read again once they are older than ``max_age``
+    seconds, in a single pass over the container's volumes. If the container
+    does not exist, the attribute dict and volume dict are both empty (and
+    not cached).
+    """
+    now = clock()
+    with _ubi_lock:
+        cached = _ubi_cache.get(name)
+        generation = _ubi_generation[0]
+    if cached is not None and now - cached[0] < max_age:
+        return cached[1], cached[2]
+    path = os.path.join(UBI_SYSFS, name)
+    try:
+        if cached is not None:
+            volumes = cached[2].keys()
+        else:
+            volumes = [v for v in os.listdir(path)
+                       if v.startswith(name + '_')]
+        attrs, volumes = _read_ubi_attrs(path, volumes)
+    except (OSError, IOError):
+        invalidate_ubi_topology(name)
+        return {}, {}
+    with _ubi_lock:
+        if generation == _ubi_generation[0]:
+            _ubi_cache[name] = (now, attrs, volumes)
+    return attrs, volumes
+
+
+def invalidate_ubi_topology(name=None):
+    """
+    Clear cached topology of the UBI container with given ``name``, or of all
+    containers if ``name`` is omitted. This should be called whenever a UBI
+    device is added, removed, or changed (e.g., resized or renamed).
+    """
+    with _ubi_lock:
+        _ubi_generation[0] += 1
+        if name is None:
+            _ubi_cache.clear()
+        else:
+            _ubi_cache.pop(name, None)
+
+
+def handle_ubi_event(device):
+    """
+    Invalidate cached UBI topology for the udev event represented by
+    ``device`` (a ``pyudev.Device`` returned by a udev monitor) if it is an
+    event in the 'ubi' subsystem.
+    """
+    if device.subsystem != 'ubi':
+        return
+    invalidate_ubi_topology(device.sys_name.split('_')[0])
+
+
+def _int(value, default=-1):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
 
 class UbiContainer(wrapper.Wrapper):
     """
@@ -290,17 +779,115 @@ class UbiContainer(wrapper.Wrapper):
     containers for the actual volumes. This class is meant to be used by
     containers, rather than volumes.
 
-    This class mainly exists to facilitate the :py:class:`~PartitionBase` API,
-    specifically the API that allows access to parent device.
+    Container and volume information is read from sysfs using
+    :py:func:`~ubi_topology`, so it is at most :py:data:`~UBI_TTL` seconds
+    old.
     """
     uuid = None
     part_table_type = 'ubi'
-    partitions = []  # TODO: Point to volumes
-    sectors = -1
-    size = -1
     is_read_only = False
     is_removable = False
 
+    def __init__(self, dev):
+        super(UbiContainer, self).__init__(dev)
+        self._partitions = None
+
+    def refresh(self):
+        """
+        Clears the :py:attr:`~device` and :py:attr:`~partitions` caches, and
+        cached UBI topology of this container.
+        """
+        with self._lock:
+            super(UbiContainer, self).refresh()
+            self._partitions = None
+            invalidate_ubi_topology(self.name)
+
+    @property
+    def partitions(self):
+        """
+        Iterable containing container's volumes as
+        :py:class:`~hwd.storage.UbiVolume` instances, ordered by volume ID.
+        """
+        return self._cached('_partitions', self._list_volumes)
+
+    def _list_volumes(self):
+        prefix = self.name + '_'
+        devs = dict((d.sys_name, d) for d in self.device.children
+                    if d.sys_name.startswith(prefix))
+        return [UbiVolume(devs[n], self)
+                for n in sorted(devs, key=lambda n: _int(n.split('_')[1]))]
+
+    def _get_int(self, name):
+        attrs, _ = ubi_topology(self.name)
+        return _int(attrs.get(name))
+
+    @property
+    def leb_size(self):
+        """
+        Logical eraseblock size in bytes, or -1 if not available.
+        """
+        return self._get_int('eraseblock_size')
+
+    @property
+    def total_lebs(self):
+        """
+        Total number of logical eraseblocks, or -1 if not available.
+        """
+        return self._get_int('total_eraseblocks')
+
+    @property
+    def avail_lebs(self):
+        """
+        Number of logical eraseblocks that are not used by any volume, or -1
+        if not available.
+        """
+        return self._get_int('avail_eraseblocks')
+
+    @property
+    def bad_blocks(self):
+        """
+        Number of bad physical eraseblocks, or -1 if not available.
+        """
+        return self._get_int('bad_peb_count')
+
+    @property
+    def reserved_for_bad(self):
+        """
+        Number of physical eraseblocks reserved for bad block handling, or -1
+        if not available.
+        """
+        return self._get_int('reserved_for_bad')
+
+    @property
+    def max_erase_counter(self):
+        """
+        Highest erase counter value among all physical eraseblocks, or -1 if
+        not available.
+        """
+        return self._get_int('max_ec')
+
+    @property
+    def size(self):
+        """
+        Container capacity in bytes, calculated from the number and size of
+        logical eraseblocks. This property evaluates to -1 if the information
+        is not available.
+        """
+        total = self.total_lebs
+        leb_size = self.leb_size
+        if total < 0 or leb_size < 0:
+            return -1
+        return total * leb_size
+
+    @property
+    def sectors(self):
+        """
+        Simulated number of sectors derived from container size. See
+        :py:attr:`~UbiVolume.sectors`.
+        """
+        size = self.size
+        return size // SECTOR_SIZE if size >= 0 else -1
+
 
 class UbiVolume(PartitionBase):
     """
@@ -319,6 +906,36 @@ class UbiVolume(PartitionBase):
     is_extended = False
     offset = 0
 
+    @property
+    def container_name(self):
+        """
+        Name of the UBI container this volume belongs to (e.g., ``'ubi0'``).
+        """
+        return self.name.split('_')[0]
+
+    @property
+    def number(self):
+        """
+        Volume ID within the container, or -1 if not known.
+        """
+        return _int(self.name.split('_')[-1])
+
+    def refresh(self):
+        """
+        Clears the :py:attr:`~device` cache and cached UBI topology of the
+        volume's container.
+        """
+        with self._lock:
+            super(UbiVolume, self).refresh()
+            invalidate_ubi_topology(self.container_name)
+
+    def get_attrib(self, name, default=None):
+        _, volumes = ubi_topology(self.container_name)
+        try:
+            return volumes[self.name][name]
+        except KeyError:
+            return super(UbiVolume, self).get_attrib(name, default)
+
     @property
     def aliases(self):
         """
@@ -326,8 +943,7 @@ class UbiVolume(PartitionBase):
         plus the ``'ubi${INDEX}:${LABEL}'`` string. The latter is used to
         identify the device in /proc/mounts table, and is not really an alias.
         """
-        return ['ubi{}:{}'.format(self.device.parent.sys_number, self.label),
-                self.node]
+        return ['{}:{}'.format(self.container_name, self.label), self.node]
 
     @property
     def sectors(self):
@@ -357,3 +973,385 @@ class UbiVolume(PartitionBase):
         information is not available for any reason.
         """
         return int(self.get_attrib('data_bytes', -1))
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except (OSError, IOError):
+        return []
+
+
+class BlockTopology(object):
+    """
+    Directed graph of the block layer. Nodes are block device names (e.g.,
+    ``'sda'``, ``'sda1'``, ``'md0'``, ``'dm-0'``, ``'loop0'``), and edges
+    point from a device to the devices that sit on top of it (partitions,
+    and holders such as device mapper and md devices).
+
+    The graph is built by a single walk over /sys/class/block, reading each
+    device's ``holders`` and ``slaves`` directories. It is kept up to date
+    incrementally by passing udev events to :py:meth:`~update`.
+
+    Example::
+
+        >>> topo = BlockTopology()
+        >>> topo.for_mount('/srv')
+        ['sda', 'sdb']
+        >>> topo.dependents('sda')
+        ['dm-0', 'md0', 'sda1']
+    """
+
+    def __init__(self, sysfs=BLOCK_SYSFS):
+        self.sysfs = sysfs
+        self._lock = threading.Lock()
+        self._lower = {}
+        self._upper = {}
+        self._physical = {}
+        self.rebuild()
+
+    def _link(self, lower, upper):
+        self._lower.setdefault(upper, set()).add(lower)
+        self._upper.setdefault(lower, set()).add(upper)
+        self._lower.setdefault(lower, set())
+        self._upper.setdefault(upper, set())
+
+    def _unlink_all(self, name):
+        for lower in self._lower.pop(name, ()):
+            self._upper.get(lower, set()).discard(name)
+        for upper in self._upper.pop(name, ()):
+            self._lower.get(upper, set()).discard(name)
+
+    def _add(self, name):
+        """
+        Add ``name`` to the graph along with edges to the devices directly
+        below and above it.
+        """
+        self._lower.setdefault(name, set())
+        self._upper.setdefault(name, set())
+        path = os.path.join(self.sysfs, name)
+        for lower in _listdir(os.path.join(path, 'slaves')):
+            self._link(lower, name)
+        for upper in _listdir(os.path.join(path, 'holders')):
+            self._link(name, upper)
+        if os.path.exists(os.path.join(path, 'partition')):
+            # Partitions are subdirectories of their disk's directory
+            disk = os.path.basename(os.path.dirname(os.path.realpath(path)))
+            self._link(disk, name)
+        else:
+            # Re-adding a disk (e.g. after a change event) must restore the
+            # edges to its partitions too
+            real = os.path.realpath(path)
+            for part in _listdir(real):
+                if os.path.exists(os.path.join(real, part, 'partition')):
+                    self._link(name, part)
+
+    def rebuild(self):
+        """
+        Discard the graph and build it again from sysfs.
+        """
+        with self._lock:
+            self._lower = {}
+            self._upper = {}
+            self._physical = {}
+            for name in _listdir(self.sysfs):
+                self._add(name)
+
+    def update(self, device):
+        """
+        Update the graph for a udev event represented by ``device`` (a
+        ``pyudev.Device`` returned by a udev monitor). Events for devices
+        outside the 'block' subsystem are ignored.
+        """
+        if device.subsystem != 'block':
+            return
+        name = device.sys_name
+        with self._lock:
+            self._physical = {}
+            self._unlink_all(name)
+            if device.action != 'remove':
+                self._add(name)
+
+    def __contains__(self, name):
+        return name in self._lower
+
+    def lower(self, name):
+        """
+        Return a sorted list of devices directly below ``name`` (e.g., the
+        disk of a partition, or the members of an md array).
+        """
+        with self._lock:
+            return sorted(self._lower.get(name, ()))
+
+    def upper(self, name):
+        """
+        Return a sorted list of devices directly on top of ``name``.
+        """
+        with self._lock:
+            return sorted(self._upper.get(name, ()))
+
+    @staticmethod
+    def _walk(edges, name):
+        seen = set()
+        stack = [name]
+        while stack:
+            for n in edges.get(stack.pop(), ()):
+                if n not in seen:
+                    seen.add(n)
+                    stack.append(n)
+        return seen
+
+    def physical_disks(self, name):
+        """
+        Return a sorted list of devices at the bottom of the stack under
+        ``name``. For a device that has nothing below it (e.g., a disk), the
+        list contains only the device itself. Results are cached until the
+        graph changes.
+        """
+        with self._lock:
+            try:
+                return list(self._physical[name])
+            except KeyError:
+                pass
+            if name not in self._lower:
+                return []
+            stack = self._walk(self._lower, name)
+            stack.add(name)
+            leaves = sorted(n for n in stack if not self._lower[n])
+            self._physical[name] = leaves
+            return list(leaves)
+
+    def dependents(self, name):
+        """
+        Return a sorted list of all devices stacked on top of ``name``,
+        directly or indirectly.
+        """
+        with self._lock:
+            return sorted(self._walk(self._upper, name))
+
+    def for_mount(self, path):
+        """
+        Return a sorted list of physical disks backing the filesystem mounted
+        at ``path``. If nothing is mounted at ``path`` or it is not backed by
+        a block device, an empty list is returned.
+        """
+        try:
+            entries = [e for e in mounts() if e.mdir == path]
+        except (OSError, IOError):
+            return []
+        if not entries:
+            return []
+        # Device mapper nodes are symlinks to /dev/dm-N
+        name = os.path.basename(os.path.realpath(entries[-1].dev))
+        return self.physical_disks(name)
+
+
+def is_removable_media(partition):
+    """
+    Return ``True`` if ``partition`` is on a removable or USB-attached disk.
+    """
+    disk = partition.disk
+    if disk is None:
+        return False
+    return disk.is_removable or disk.bus == 'usb'
+
+
+class _Media(object):
+
+    def __init__(self, partition, settle_at):
+        self.partition = partition
+        self.aliases = partition.aliases
+        self.settle_at = settle_at
+        self.mount_point = None
+
+
+class MediaWatcher(object):
+    """
+    Tracks removable media and calls ``callback`` with a
+    :py:class:`MediaEvent` object when a partition becomes ready to use, and
+    when it stops being usable.
+
+    A partition is ready once it was added by udev and no further udev events
+    were received for it for ``debounce`` seconds, it appears in the mount
+    table, and its usage information can be obtained. Partitions that are
+    added and removed within the debounce period do not cause any events.
+    Each ready event is followed by exactly one gone event, which is emitted
+    as soon as the partition is unmounted or removed.
+
+    Media without a partition table, where the filesystem is on the disk
+    itself (common on USB sticks and SD cards), are tracked as well. They are
+    reported as :py:class:`Partition` objects that wrap the disk device, and
+    whose :py:attr:`~PartitionBase.disk` is a :py:class:`Disk` object for the
+    same device. Partition table properties of such objects (e.g.,
+    ``number`` and ``offset``) are not available.
+
+    Udev events and mount table changes are received through file
+    descriptors, so events are emitted without polling delays. Partitions
+    that are already present when the watcher starts are considered settled.
+
+    ``only`` is a function that takes a :py:class:`Partition` object and
+    returns ``True`` for partitions that should be tracked. The callback is
+    invoked from the watcher thread; exceptions it raises are logged and do
+    not stop the watcher.
+
+    Example::
+
+        >>> def on_media(event):
+        ...     if event.state == storage.MEDIA_READY:
+        ...         import_from(event.mount_point, event.stat.free)
+        ...     else:
+        ...         cancel_import(event.mount_point)
+        >>> watcher = storage.MediaWatcher(on_media)
+        >>> watcher.start()
+    """
+
+    def __init__(self, callback, debounce=MEDIA_DEBOUNCE,
+                 only=is_removable_media):
+        self.callback = callback
+        self.debounce = debounce
+        self.only = only
+        self._media = {}
+        self._thread = None
+        self._wake_r, self._wake_w = os.pipe()
+
+    @staticmethod
+    def _is_media(dev):
+        """
+        Return ``True`` if ``dev`` is a partition, or a disk with a
+        filesystem and no partition table.
+        """
+        if dev.device_type == 'partition':
+            return True
+        return (dev.device_type == 'disk' and
+                dev.get('ID_FS_USAGE') == 'filesystem')
+
+    def _emit(self, state, partition, mount_point, stat):
+        try:
+            self.callback(MediaEvent(state, partition, mount_point, stat))
+        except Exception:
+            # A broken callback must not kill the watcher thread
+            log.exception('Error in media watcher callback')
+
+    def _track(self, dev, settle_at):
+        if dev.device_type == 'disk':
+            part = Partition(dev, Disk(dev))
+        else:
+            part = Partition(dev)
+        try:
+            if not self.only(part):
+                return
+        except ValueError:
+            # Disk disappeared while we were looking at it
+            return
+        self._media[part.name] = _Media(part, settle_at)
+
+    def handle_event(self, device, now):
+        """
+        Process a ``pyudev.Device`` object received from a udev monitor.
+        """
+        if device.device_type not in ('partition', 'disk'):
+            return
+        media = self._media.get(device.sys_name)
+        if device.action == 'remove':
+            if media is None:
+                return
+            del self._media[device.sys_name]
+            if media.mount_point is not None:
+                self._emit(MEDIA_GONE, media.partition, media.mount_point,
+                           None)
+        elif media is None:
+            if self._is_media(device):
+                self._track(device, now + self.debounce)
+        elif media.mount_point is None:
+            # Still flapping, restart the debounce period
+            media.settle_at = now + self.debounce
+
+    def update(self, mtab, now):
+        """
+        Emit events for tracked partitions based on ``mtab``, a list of
+        :py:class:`MtabEntry` objects. Returns the time at which partitions
+        should be checked again, or ``None`` if only a udev event or a mount
+        table change can change their state.
+        """
+        due = None
+        for media in list(self._media.values()):
+            mount_points = [e.mdir for e in mtab if e.dev in media.aliases]
+            if (media.mount_point is not None and
+                    media.mount_point not in mount_points):
+                mp, media.mount_point = media.mount_point, None
+                self._emit(MEDIA_GONE, media.partition, mp, None)
+            if media.mount_point is not None or not mount_points:
+                continue
+            if media.settle_at > now:
+                due = min(due or media.settle_at, media.settle_at)
+                continue
+            # Last mount point is the newest (see Mountable.stat)
+            mp = mount_points[-1]
+            try:
+                stat = fstat(mp)
+            except (OSError, ZeroDivisionError):
+                # Filesystem not accessible yet, try again later
+                retry = now + self.debounce
+                due = min(due or retry, retry)
+                continue
+            media.mount_point = mp
+            self._emit(MEDIA_READY, media.partition, mp, stat)
+        return due
+
+    def run(self):
+        """
+        Run the watcher loop until :py:meth:`~stop` is called. This is
+        normally invoked through :py:meth:`~start`.
+        """
+        # Monitor is started before enumerating devices so that no events
+        # are lost in between.
+        mon = udev.monitor('block')
+        mtab_monitor = MountMonitor()
+        try:
+            self._media = {}
+            for dev in udev.devices_by_subsystem('block', self._is_media):
+                self._track(dev, 0)
+            while True:
+                try:
+                    mtab = list(mounts())
+                except (OSError, IOError):
+                    mtab = []
+                now = clock()
+                due = self.update(mtab, now)
+                timeout = None if due is None else max(0, due - now)
+                readable, _, exceptional = select.select(
+                    [mon, self._wake_r], [], [mtab_monitor], timeout)
+                if (self._wake_r in readable and
+                        b'q' in os.read(self._wake_r, 512)):
+                    return
+                if exceptional:
+                    mtab_monitor.poll(timeout=0)
+                if mon in readable:
+                    now = clock()
+                    while True:
+                        dev = mon.poll(timeout=0)
+                        if dev is None:
+                            break
+                        self.handle_event(dev, now)
+        finally:
+            mtab_monitor.close()
+
+    def start(self):
+        """
+        Start the watcher loop in a daemon thread.
+        """
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the watcher loop, wait for the thread to finish, and close the
+        pipe used to wake it. A stopped watcher cannot be started again.
+        """
+        os.write(self._wake_w, b'q')
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        os.close(self._wake_r)
+        os.close(self._wake_w)
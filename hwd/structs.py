@@ -0,0 +1,17 @@
+"""
+Data types shared by the wrappers and by modules that only work with
+snapshots of their data.
+
+This module does not depend on pyudev or netifaces, so it can be imported by
+light consumers such as :py:mod:`hwd.snapshot` readers. The types are also
+available from :py:mod:`hwd.storage`.
+"""
+
+from collections import namedtuple
+
+#: namedtuple representing a single mtab entry
+MtabEntry = namedtuple('MtabEntry', ['dev', 'mdir', 'fstype', 'opts', 'cfreq',
+                                     'cpass'])
+
+#: namedtuple representing filesystem usage statistics
+Fstat = namedtuple('Fstat', ['total', 'used', 'free', 'pct_used', 'pct_free'])
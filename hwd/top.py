@@ -0,0 +1,337 @@
+"""
+Live terminal view of storage and network devices.
+
+The view is built once from the inventory and afterwards only updated in
+response to events: udev events and mount table changes cause the device
+list to be rebuilt, while I/O and traffic counters and link state are
+sampled from sysfs at a short interval, and disk usage at a longer one.
+Only screen rows whose contents changed are redrawn.
+
+This module is used by the ``hwd watch`` command.
+"""
+
+from __future__ import division
+
+import curses
+import os
+import select
+import sys
+import time
+
+from . import inventory
+from . import records
+from . import storage
+from . import udev
+from .compat import clock
+
+#: Default interval between counter samples in seconds
+DEFAULT_INTERVAL = 1
+
+#: Default interval between disk usage and address updates in seconds
+DEFAULT_USAGE_INTERVAL = 10
+
+PREFIXES = ('', 'K', 'M', 'G', 'T', 'P')
+
+
+def humanize(size):
+    """
+    Return ``size`` in bytes as a short human-readable string.
+    """
+    order = 0
+    while size >= 1000 and order < len(PREFIXES) - 1:
+        size /= 1000
+        order += 1
+    if order == 0:
+        return '{}B'.format(int(size))
+    return '{:.1f}{}B'.format(size, PREFIXES[order])
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as fd:
+            return fd.read().strip()
+    except (OSError, IOError):
+        return None
+
+
+def read_block_bytes(sys_path):
+    """
+    Return a ``(read, written)`` tuple of byte counters for the block device
+    at ``sys_path``, or ``None`` if not available.
+    """
+    stat = _read(os.path.join(sys_path, 'stat'))
+    if not stat:
+        return None
+    fields = stat.split()
+    return (int(fields[2]) * storage.SECTOR_SIZE,
+            int(fields[6]) * storage.SECTOR_SIZE)
+
+
+def read_net_bytes(sys_path):
+    """
+    Return a ``(received, transmitted)`` tuple of byte counters for the
+    network interface at ``sys_path``, or ``None`` if not available.
+    """
+    rx = _read(os.path.join(sys_path, 'statistics', 'rx_bytes'))
+    tx = _read(os.path.join(sys_path, 'statistics', 'tx_bytes'))
+    if rx is None or tx is None:
+        return None
+    return int(rx), int(tx)
+
+
+class Row(object):
+    """
+    Single row of the view. ``kind`` is ``'disk'``, ``'part'``, or
+    ``'iface'``, and ``record`` is the device record (see
+    :py:mod:`hwd.records`). ``wrapper`` is the wrapper object the record was
+    created from, and is used to update the record.
+    """
+
+    def __init__(self, kind, record, wrapper=None):
+        self.kind = kind
+        self.record = record
+        self.wrapper = wrapper
+        self.rates = None
+        self._counters = None
+        self._sampled_at = None
+
+    def sample(self, now):
+        """
+        Read the row's counters and update its rates.
+        """
+        path = self.record.get('system_path')
+        if not path:
+            return
+        if self.kind == 'iface':
+            counters = read_net_bytes(path)
+            carrier = _read(os.path.join(path, 'carrier'))
+            self.record['is_connected'] = carrier == '1'
+        else:
+            counters = read_block_bytes(path)
+        if counters is None:
+            return
+        if self._counters is not None and now > self._sampled_at:
+            elapsed = now - self._sampled_at
+            self.rates = tuple(max(0, (new - old) / elapsed)
+                               for new, old in zip(counters, self._counters))
+        self._counters = counters
+        self._sampled_at = now
+
+    def update_usage(self):
+        """
+        Update disk usage of a partition row, or addresses of an interface
+        row.
+        """
+        rec = self.record
+        if self.kind == 'part':
+            rec['stat'] = records.stat_record(rec['mount_points'])
+        elif self.kind == 'iface' and self.wrapper is not None:
+            try:
+                rec['ipv4addr'] = self.wrapper.ipv4addr
+                rec['ipv6addr'] = self.wrapper.ipv6addr
+                rec['signal_level'] = self.wrapper.signal_level
+            except ValueError:
+                # Interface went away, udev event will remove the row
+                pass
+
+    def _rates(self, labels):
+        if self.rates is None:
+            return ''
+        return '  '.join('{} {:>8}/s'.format(l, humanize(r))
+                         for l, r in zip(labels, self.rates))
+
+    def render(self):
+        """
+        Return the row's text.
+        """
+        r = self.record
+        if self.kind == 'disk':
+            return '{:<10} {:<5} {:<24} {:>9}  {}'.format(
+                r['name'], r['bus'] or '-', (r['model'] or '-')[:24],
+                humanize(max(0, r['size'])), self._rates(('r', 'w')))
+        if self.kind == 'part':
+            stat = r['stat']
+            if stat:
+                usage = '{:>9}/{:<9} {:>3}%'.format(
+                    humanize(stat['used']), humanize(stat['total']),
+                    stat['pct_used'])
+            else:
+                usage = '{:<24}'.format('not mounted')
+            mp = r['mount_points'][-1] if r['mount_points'] else '-'
+            return '  {:<8} {:<6} {:<16} {}  {}'.format(
+                r['name'], r['format'] or '-', mp[:16], usage,
+                self._rates(('r', 'w')))
+        state = 'up' if r['is_connected'] else 'down'
+        extra = ''
+        if r.get('signal_level') is not None:
+            extra = ' sig {}'.format(r['signal_level'])
+        return '{:<10} {:<5} {:<4} {:<15} {}{}'.format(
+            r['name'], r['type'] or '-', state, r['ipv4addr'] or '-',
+            self._rates(('rx', 'tx')), extra)
+
+
+class Model(object):
+    """
+    Rows of the view, kept up to date by :py:meth:`~rebuild` (on events) and
+    :py:meth:`~sample` (periodically).
+    """
+
+    def __init__(self):
+        # Devices are only looked up again when events invalidate them
+        self.inventory = inventory.Inventory(default_ttl=float('inf'))
+        self.rows = []
+
+    def rebuild(self, keys=()):
+        """
+        Invalidate inventory ``keys`` and rebuild the rows. Counters of rows
+        for devices that are still present are carried over, so rates remain
+        available.
+        """
+        for key in keys:
+            self.inventory.invalidate(key)
+        data = records.collect(self.inventory)
+        ifaces = dict((i.name, i) for i in self.inventory.ifaces())
+        old = dict(((row.kind, row.record.get('system_path')), row)
+                   for row in self.rows)
+        rows = []
+
+        def add(kind, rec):
+            prev = old.get((kind, rec.get('system_path')))
+            row = Row(kind, rec, ifaces.get(rec['name']))
+            if prev is not None:
+                row.rates = prev.rates
+                row._counters = prev._counters
+                row._sampled_at = prev._sampled_at
+                if 'signal_level' in prev.record:
+                    # Only refreshed with usage; keep it until then
+                    rec.setdefault('signal_level',
+                                   prev.record['signal_level'])
+            rows.append(row)
+
+        for disk in data['disks']:
+            add('disk', disk)
+            for part in disk['partitions']:
+                add('part', part)
+        for vol in data['ubi']:
+            add('part', vol)
+        for iface in data['ifaces']:
+            add('iface', iface)
+        self.rows = rows
+
+    def sample(self, usage=False):
+        """
+        Sample counters of all rows. If ``usage`` is ``True``, disk usage and
+        addresses are updated as well.
+        """
+        now = clock()
+        for row in self.rows:
+            row.sample(now)
+            if usage:
+                row.update_usage()
+
+    def lines(self):
+        """
+        Return a list of lines to display.
+        """
+        header = 'hwd watch  {}  ({} rows, q to quit)'.format(
+            time.strftime('%H:%M:%S'), len(self.rows))
+        return [header, ''] + [row.render() for row in self.rows]
+
+
+class Screen(object):
+    """
+    Draws lines on a curses window, redrawing only lines that changed since
+    the previous call to :py:meth:`~draw`.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._drawn = []
+
+    def draw(self, lines):
+        height, width = self.window.getmaxyx()
+        lines = lines[:height]
+        for y, text in enumerate(lines):
+            if y < len(self._drawn) and self._drawn[y] == text:
+                continue
+            try:
+                self.window.addnstr(y, 0, text, width - 1)
+                self.window.clrtoeol()
+            except curses.error:
+                pass
+        for y in range(len(lines), min(len(self._drawn), height)):
+            self.window.move(y, 0)
+            self.window.clrtoeol()
+        self._drawn = lines
+        self.window.refresh()
+
+    def invalidate(self):
+        """
+        Force all lines to be redrawn on the next call to :py:meth:`~draw`.
+        """
+        self.window.clear()
+        self._drawn = []
+
+
+def run(window, interval=DEFAULT_INTERVAL,
+        usage_interval=DEFAULT_USAGE_INTERVAL):
+    """
+    Run the view in curses ``window`` until 'q' is pressed.
+    """
+    curses.curs_set(0)
+    window.nodelay(True)
+    screen = Screen(window)
+    model = Model()
+    model.rebuild()
+    model.sample(usage=True)
+    mon = udev.monitor('block', 'net', 'ubi')
+    mounts = storage.MountMonitor()
+    next_sample = clock() + interval
+    next_usage = clock() + usage_interval
+    try:
+        while True:
+            screen.draw(model.lines())
+            timeout = max(0, next_sample - clock())
+            readable, _, exceptional = select.select(
+                [mon, sys.stdin], [], [mounts], timeout)
+            keys = set()
+            if mon in readable:
+                # Drain all pending events so a burst (e.g. a disk with many
+                # partitions appearing) causes a single rebuild
+                while True:
+                    dev = mon.poll(timeout=0)
+                    if dev is None:
+                        break
+                    storage.handle_ubi_event(dev)
+                    keys.update((dev.subsystem, 'mounts'))
+            if exceptional and mounts.poll(timeout=0):
+                keys.add('mounts')
+            if keys:
+                try:
+                    model.rebuild(keys)
+                except ValueError:
+                    # A device vanished while being read; a later event will
+                    # trigger another rebuild
+                    pass
+            if sys.stdin in readable:
+                key = window.getch()
+                if key in (ord('q'), ord('Q')):
+                    return
+                if key == curses.KEY_RESIZE:
+                    screen.invalidate()
+            now = clock()
+            if now >= next_sample:
+                usage = now >= next_usage
+                model.sample(usage)
+                next_sample = now + interval
+                if usage:
+                    next_usage = now + usage_interval
+    finally:
+        mounts.close()
+
+
+def main(interval=DEFAULT_INTERVAL, usage_interval=DEFAULT_USAGE_INTERVAL):
+    """
+    Set up the terminal and run the view.
+    """
+    curses.wrapper(run, interval, usage_interval)
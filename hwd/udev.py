@@ -23,3 +23,29 @@ def devices_by_subsystem(subsys, only=lambda x: True):
         if not only(d):
             continue
         yield d
+
+
+def monitor(*subsystems):
+    """
+    Return a started ``pyudev.Monitor`` object that receives events for
+    devices in specified subsystems. If no subsystems are specified, events
+    for all devices are received.
+
+    The monitor's ``poll()`` method returns ``pyudev.Device`` objects whose
+    ``action`` attribute is set to the event type (e.g., ``'add'``,
+    ``'remove'``, or ``'change'``). Monitor objects have a ``fileno()``
+    method, so they can be used with ``select()``.
+
+    Example::
+
+        >>> mon = monitor('block', 'net')
+        >>> dev = mon.poll(timeout=1)
+        >>> dev.action, dev.sys_name
+        (u'add', u'sdb')
+    """
+    ctx = pyudev.Context()
+    mon = pyudev.Monitor.from_netlink(ctx)
+    for subsys in subsystems:
+        mon.filter_by(subsys)
+    mon.start()
+    return mon
@@ -1,3 +1,5 @@
+import threading
+
 import pyudev
 
 
@@ -8,11 +10,50 @@ class Wrapper(object):
     ``dev`` is a ``pyudev.Device`` instance. Device's ``sys_name`` property is
     stored as ``name`` property on the wrapper instance.
 
+    Wrapper objects can be shared between threads. Cached values (such as
+    :py:attr:`~device`) are read without locking, and are filled at most
+    once per cache lifetime under a lock that belongs to the wrapper
+    object, so concurrent readers never perform duplicate lookups.
+    :py:meth:`~refresh` holds the same lock, so a refresh never interleaves
+    with a fill, and a value looked up before a refresh is never cached
+    after it.
+
     """
 
     def __init__(self, dev):
         self.name = dev.sys_name
         self._device = dev
+        # Reentrant because filling one cached value may need another
+        self._lock = threading.RLock()
+
+    def _cached(self, attr, fill):
+        """
+        Return the value of the ``attr`` instance attribute, calling ``fill``
+        to obtain and store it if it is ``None``. Values are stored with a
+        single attribute assignment, so readers see either ``None`` or the
+        complete value.
+        """
+        value = getattr(self, attr)
+        if value is not None:
+            return value
+        with self._lock:
+            # Another thread may have filled the value while we waited
+            value = getattr(self, attr)
+            if value is None:
+                value = fill()
+                setattr(self, attr, value)
+            return value
+
+    def _lookup(self):
+        # We always create a new context and look up the devices because they
+        # may disappear or change their state between lookups.
+        ctx = pyudev.Context()
+        devs = ctx.list_devices(sys_name=self.name)
+        try:
+            return list(devs)[0]
+        except IndexError:
+            raise ValueError(
+                'Device {} no longer present in context'.format(self.name))
 
     @property
     def device(self):
@@ -22,17 +63,7 @@ class Wrapper(object):
         performed to obtain the device object. This cache is invalidated by
         :py:meth:`~refresh` method.
         """
-        # We always create a new context and look up the devices because they
-        # may disappear or change their state between lookups.
-        if not self._device:
-            ctx = pyudev.Context()
-            devs = ctx.list_devices(sys_name=self.name)
-            try:
-                self._device = list(devs)[0]
-            except IndexError:
-                raise ValueError(
-                    'Device {} no longer present in context'.format(self.name))
-        return self._device
+        return self._cached('_device', self._lookup)
 
     def get_attrib(self, name, default=None):
         return self.device.attributes.get(name, default)
@@ -46,7 +77,8 @@ class Wrapper(object):
             Lookup is done when the :py:attr:`~device`
             property is accessed.
         """
-        self._device = None
+        with self._lock:
+            self._device = None
 
     @property
     def system_path(self):
@@ -23,6 +23,15 @@ setup(
         'pyudev>=0.17',
         'netifaces>=0.10.4',
     ],
+    extras_require={
+        'msgpack': ['msgpack>=0.5'],
+        'scandir': ['scandir>=1.5'],
+    },
+    entry_points={
+        'console_scripts': [
+            'hwd = hwd.cli:main',
+        ],
+    },
     classifiers=[
         'Development Status :: 2 - Pre-Alpha',
         'Intended Audience :: Developers',